@@ -0,0 +1,131 @@
+"""
+Bulk import of local PubMed baseline files (pubmedXXnXXXX.xml.gz).
+
+Usage:
+    python -m Fetch_data.bulk_import /mirror/pubmed/baseline/*.xml.gz --mesh Neoplasms --keyword diabetes
+"""
+import argparse
+import glob
+import gzip
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, List, Optional, Sequence
+
+from .pipeline import IngestionPipeline
+from .pubmed import PubMedRetriever as pb
+
+
+class ArticleFilter:
+    """
+    Keep an article if it has one of the MeSH descriptors or if one of the
+    keywords appears in its title or abstract (case-insensitive).
+    With no terms at all every article is kept.
+    """
+    def __init__(self, mesh_terms: Optional[Sequence[str]] = None, keywords: Optional[Sequence[str]] = None) -> None:
+        self.mesh_terms = {m.lower() for m in mesh_terms or []}
+        self.keywords = [k.lower() for k in keywords or []]
+
+    def __call__(self, article) -> bool:
+        if not self.mesh_terms and not self.keywords:
+            return True
+        if self.mesh_terms:
+            for descriptor in article.iterfind(".//MeshHeading/DescriptorName"):
+                if descriptor.text and descriptor.text.lower() in self.mesh_terms:
+                    return True
+        if self.keywords:
+            parts = [article.findtext(".//ArticleTitle") or ""]
+            parts.extend(section.text or "" for section in article.iterfind(".//AbstractText"))
+            text = " ".join(parts).lower()
+            return any(k in text for k in self.keywords)
+        return False
+
+
+def parse_baseline_file(path: str, article_filter: ArticleFilter) -> List:
+    """
+    Parse one gzip baseline file in a worker process.
+    :param path: path to a pubmedXXnXXXX.xml.gz file
+    :param article_filter: predicate applied before an article is converted
+    :return: list of PubMedRecord (as yielded by iter_pubmed_abstracts)
+    """
+    with gzip.open(path, "rb") as f:
+        return list(pb.iter_articles(f, keep=article_filter))
+
+
+class BaselineImporter:
+    """
+    Parse many baseline files in parallel worker processes and feed the
+    records into the batched embed-and-upsert stages of IngestionPipeline.
+    At most ``2 * workers`` files are in flight, so memory stays bounded.
+    """
+    def __init__(
+        self,
+        collection_name: str = "pubmed_collection",
+        workers: Optional[int] = None,
+        mesh_terms: Optional[Sequence[str]] = None,
+        keywords: Optional[Sequence[str]] = None,
+        batch_size: int = 256,
+        **pipeline_options
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.article_filter = ArticleFilter(mesh_terms, keywords)
+        self.pipeline = IngestionPipeline(collection_name=collection_name, batch_size=batch_size, **pipeline_options)
+        self.files_done = 0
+
+    def iter_records(self, paths: Sequence[str]) -> Iterator:
+        pending = set()
+        remaining = list(paths)
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while remaining or pending:
+                while remaining and len(pending) < 2 * self.workers:
+                    pending.add(executor.submit(parse_baseline_file, remaining.pop(0), self.article_filter))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        records = future.result()
+                    except Exception as e:
+                        print(f"⚠️ Failed to parse a baseline file: {e}")
+                        continue
+                    self.files_done += 1
+                    elapsed = time.perf_counter() - started
+                    print(f"📦 {self.files_done}/{len(paths)} files parsed, "
+                          f"{len(records)} matching articles ({elapsed:.0f}s)")
+                    yield from records
+
+    def run(self, paths: Sequence[str]) -> dict:
+        """
+        Import the given baseline files.
+        :param paths: list of .xml.gz paths
+        :return: pipeline statistics
+        """
+        print(f"🗂️ Importing {len(paths)} baseline files with {self.workers} worker processes...")
+        return self.pipeline.run_records(self.iter_records(paths))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Import local PubMed baseline XML.gz files into ChromaDB.")
+    parser.add_argument("files", nargs="+", help="baseline files or glob patterns")
+    parser.add_argument("--mesh", action="append", default=[], help="MeSH descriptor to keep (repeatable)")
+    parser.add_argument("--keyword", action="append", default=[], help="title/abstract keyword to keep (repeatable)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--collection", default="pubmed_collection")
+    args = parser.parse_args(argv)
+
+    paths = sorted({p for pattern in args.files for p in glob.glob(pattern)})
+    if not paths:
+        print("🚨 No baseline files matched.")
+        return
+
+    BaselineImporter(
+        collection_name=args.collection,
+        workers=args.workers,
+        mesh_terms=args.mesh,
+        keywords=args.keyword,
+        batch_size=args.batch_size
+    ).run(paths)
+
+
+if __name__ == "__main__":
+    main()
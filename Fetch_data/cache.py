@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when a request is not in the cache."""
+
+
+class ResponseCache:
+    """
+    Content-addressed, gzip-compressed on-disk cache of raw E-utilities responses.
+
+    Layout under ``directory``:
+        index/<key>.json      request key -> object hash, fetch time, params
+        objects/ab/<hash>.gz  response body, named by the sha256 of its content
+
+    Identical bodies are stored once. In offline mode every lookup is served
+    from disk (ignoring the TTL) and misses raise CacheMiss.
+    """
+    def __init__(self, directory: str = "./pubmed_cache", ttl_seconds: float = 30 * 86400, offline: bool = False) -> None:
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(directory, "index"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+
+    @staticmethod
+    def normalize(url: str, params: Dict[str, Any]) -> str:
+        """
+        Canonical form of a request: sorted keys, stripped values and sorted
+        id lists, so equivalent requests share one cache entry.
+        """
+        normalized = {}
+        for key, value in params.items():
+            value = str(value).strip()
+            if key == "id":
+                value = ",".join(sorted(v.strip() for v in value.split(",") if v.strip()))
+            normalized[key] = value
+        return json.dumps({"url": url, "params": normalized}, sort_keys=True)
+
+    def key(self, url: str, params: Dict[str, Any]) -> str:
+        return hashlib.sha256(self.normalize(url, params).encode("utf-8")).hexdigest()
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.directory, "index", f"{key}.json")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], f"{digest}.gz")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, url: str, params: Dict[str, Any]) -> Optional[bytes]:
+        """
+        :return: cached body, or None if missing or expired (online mode only)
+        :raises CacheMiss: in offline mode when the request was never cached
+        """
+        index_path = self._index_path(self.key(url, params))
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            expired = time.time() - entry["fetched_at"] > self.ttl_seconds
+            if not expired or self.offline:
+                with gzip.open(self._object_path(entry["object"]), "rb") as f:
+                    body = f.read()
+                self.hits += 1
+                return body
+        except (OSError, ValueError, KeyError):
+            pass
+
+        self.misses += 1
+        if self.offline:
+            raise CacheMiss(f"Offline mode: no cached response for {self.normalize(url, params)}")
+        return None
+
+    def put(self, url: str, params: Dict[str, Any], body: bytes) -> None:
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            self._write_atomic(object_path, gzip.compress(body))
+        entry = {
+            "object": digest,
+            "fetched_at": time.time(),
+            "request": json.loads(self.normalize(url, params))
+        }
+        self._write_atomic(self._index_path(self.key(url, params)), json.dumps(entry).encode("utf-8"))
+
+    def purge_expired(self) -> int:
+        """
+        Drop expired index entries and objects no longer referenced.
+        :return: number of index entries removed
+        """
+        index_dir = os.path.join(self.directory, "index")
+        live, removed = set(), 0
+        for name in os.listdir(index_dir):
+            path = os.path.join(index_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if time.time() - entry.get("fetched_at", 0) > self.ttl_seconds:
+                os.remove(path)
+                removed += 1
+            else:
+                live.add(entry.get("object"))
+
+        objects_dir = os.path.join(self.directory, "objects")
+        for root, _, files in os.walk(objects_dir):
+            for name in files:
+                if name.endswith(".gz") and name[:-3] not in live:
+                    os.remove(os.path.join(root, name))
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "offline": self.offline
+        }
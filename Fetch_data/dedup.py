@@ -0,0 +1,192 @@
+import hashlib
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .fetch_data import store_data
+
+# Mersenne prime 2^31 - 1: a * x + b stays below 2^63 for 31-bit a, b, x
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class NearDuplicateDetector:
+    """
+    MinHash/LSH detector for near-identical abstracts (errata, republications).
+
+    Each abstract is reduced to word shingles and a MinHash signature;
+    signatures are split into bands and bucketed, so only articles sharing a
+    band are compared. A candidate whose estimated Jaccard similarity
+    reaches ``threshold`` is linked to the first article of its cluster (the
+    representative), which is the only one indexed.
+    """
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 5,
+        min_words: int = 30,
+        path: Optional[str] = None,
+        seed: int = 1
+    ) -> None:
+        """
+        :param threshold: estimated Jaccard similarity above which two abstracts are duplicates
+        :param num_perm: MinHash signature length (must be divisible by ``bands``)
+        :param bands: LSH bands; more bands find more (lower-similarity) candidates
+        :param shingle_size: words per shingle
+        :param min_words: shorter abstracts are never deduplicated (placeholders, one-liners)
+        :param path: optional .npz file keeping signatures and links across runs
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_words = min_words
+        self.path = path
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm).astype(np.int64)
+        self._b = rng.randint(0, _PRIME, size=num_perm).astype(np.int64)
+        self._lock = threading.Lock()
+
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets: Dict[tuple, str] = {}
+        self.links: Dict[str, List[str]] = {}
+        self.changed: set = set()
+        self.seen = 0
+        self.duplicates = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        words = _WORD.findall(text.lower())
+        if len(words) < self.min_words:
+            return None
+        shingles = {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") % _PRIME
+             for s in shingles),
+            dtype=np.int64,
+            count=len(shingles)
+        )
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        r = self.rows_per_band
+        return [(band, signature[band * r:(band + 1) * r].tobytes()) for band in range(self.bands)]
+
+    def _match(self, pmid: str, signature: np.ndarray, keys: List[tuple],
+               local_buckets: Dict[tuple, str], local_signatures: Dict[str, np.ndarray]) -> Optional[str]:
+        # Registered representatives first, then earlier records of the same batch
+        for buckets, signatures in ((self.buckets, self.signatures), (local_buckets, local_signatures)):
+            for key in keys:
+                candidate = buckets.get(key)
+                if candidate is None or candidate == pmid:
+                    continue
+                if float(np.mean(signatures[candidate] == signature)) >= self.threshold:
+                    return candidate
+        return None
+
+    def plan(self, records: List[Any]) -> Dict[str, Any]:
+        """
+        Classify a batch without registering anything, so a batch that is
+        retried or never stored leaves no trace. Call commit() once the kept
+        records are stored.
+        :return: {"kept": records to index, "links": {duplicate pmid: representative pmid},
+            "signatures": {pmid: signature of kept records}, "seen": batch size}
+        """
+        kept, links, signatures = [], {}, {}
+        local_buckets: Dict[tuple, str] = {}
+        for rec in records:
+            pmid = rec.get("pmid", "")
+            signature = self.signature(store_data.flatten_abstract(rec.get("abstract", {})))
+            if signature is None:
+                kept.append(rec)
+                continue
+            keys = self._band_keys(signature)
+            with self._lock:
+                representative = self._match(pmid, signature, keys, local_buckets, signatures)
+            if representative is not None:
+                links[pmid] = representative
+                continue
+            kept.append(rec)
+            signatures[pmid] = signature
+            for key in keys:
+                local_buckets.setdefault(key, pmid)
+        return {"kept": kept, "links": links, "signatures": signatures, "seen": len(records)}
+
+    def commit(self, links: Dict[str, str], signatures: Dict[str, np.ndarray], seen: int = 0) -> None:
+        """
+        Register stored representatives and their duplicates. Idempotent:
+        a link that is already known is not counted again.
+        :param links: duplicate pmid -> representative pmid
+        :param signatures: pmid -> signature of the stored records
+        :param seen: records classified, for stats
+        """
+        with self._lock:
+            self.seen += seen
+            for pmid, signature in signatures.items():
+                # A representative (or a re-ingested, updated article) keeps its own buckets
+                self.signatures[pmid] = signature
+                for key in self._band_keys(signature):
+                    self.buckets.setdefault(key, pmid)
+            for pmid, representative in links.items():
+                duplicates = self.links.setdefault(representative, [])
+                if pmid not in duplicates:
+                    duplicates.append(pmid)
+                    self.duplicates += 1
+                    self.changed.add(representative)
+
+    def pop_changed(self) -> Dict[str, List[str]]:
+        """
+        :return: representatives that gained duplicates since the last call, with all their duplicates
+        """
+        with self._lock:
+            changed = {rep: list(self.links[rep]) for rep in self.changed}
+            self.changed = set()
+        return changed
+
+    def duplicates_of(self, pmid: str) -> List[str]:
+        with self._lock:
+            return list(self.links.get(pmid, []))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "seen": self.seen,
+            "duplicates": self.duplicates,
+            "clusters": len(self.links),
+            "dedup_ratio": round(self.duplicates / self.seen, 4) if self.seen else 0.0
+        }
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            pmids = list(self.signatures)
+            matrix = np.asarray([self.signatures[p] for p in pmids], dtype=np.int64).reshape(len(pmids), self.num_perm)
+            link_pairs = [(rep, dup) for rep, dups in self.links.items() for dup in dups]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            pmids=np.asarray(pmids, dtype=str),
+            signatures=matrix,
+            links=np.asarray(link_pairs, dtype=str).reshape(len(link_pairs), 2)
+        )
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> None:
+        data = np.load(self.path)
+        if data["signatures"].shape[1:] != (self.num_perm,):
+            print(f"ℹ️ Ignoring {self.path}: built with a different signature length")
+            return
+        for pmid, signature in zip(data["pmids"].tolist(), data["signatures"]):
+            self.signatures[pmid] = signature
+            for key in self._band_keys(signature):
+                self.buckets.setdefault(key, pmid)
+        for rep, dup in data["links"].tolist():
+            self.links.setdefault(rep, []).append(dup)
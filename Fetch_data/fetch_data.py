@@ -1,5 +1,7 @@
 from .pubmed import PubMedRetriever as pb
 import chromadb
+from embedding import get_embedder
+from hnsw_config import collection_metadata, model_matches
 from typing import List, Dict, Any
 import time
 import json
@@ -8,9 +10,15 @@ class store_data:
     """
     A class to store the extracted information into the vector database with the meta data in the directory parent.pumed
     """
-    def __init__(self, search_topic: str = "Cancer", max_results: int = 50) -> None:
+    def __init__(self, search_topic: str = "Cancer", max_results: int = 50, incremental: bool = False) -> None:
         self.search_topic = search_topic
         self.max_results = max_results
+        self.incremental = incremental
+        self.pmids = []
+
+        if incremental:
+            # PubMedSync runs its own (delta) search from the topic checkpoint
+            return
         
         print(f"🔍 Searching PubMed for: '{search_topic}' with max_results={max_results}")
         
@@ -97,10 +105,38 @@ class store_data:
         
         return str(authors_data)
 
-    def stored_in_chroma(self, records: List[Dict[str, Any]], collection_name: str = "pubmed_collection") -> bool:
+    @staticmethod
+    def build_entry(rec, index: int = 0) -> tuple:
+        """
+        Convert one record into the (id, document, metadata) triple stored in ChromaDB.
+        :param rec: Record dict or PubMedRecord
+        :param index: Position of the record, used for the fallback id
+        :return: Tuple of (record_id, document_text, metadata)
+        """
+        # Generate a unique ID for each record
+        pmid = rec.get('pmid', '')
+        record_id = f"pubmed_{pmid}" if pmid else f"item_{index}_{hash(str(rec))}"
+
+        # Create document text
+        title = (rec.get('title') or 'No Title').strip()
+        abstract_text = store_data.flatten_abstract(rec.get('abstract', {}))
+        document_text = f"Title: {title}\n\nAbstract: {abstract_text}"
+
+        # Create metadata with properly formatted authors
+        metadata = {
+            "title": title,
+            "journal": rec.get('journal', 'Unknown Journal'),
+            "authors": store_data.format_authors(rec.get('authors', [])),
+            "publication_date": rec.get('publication_date', 'Unknown'),
+            "pmid": pmid,
+            "source": "pubmed"
+        }
+        return record_id, document_text, metadata
+
+    def stored_in_chroma(self, records: List[Any], collection_name: str = "pubmed_collection") -> bool:
         """
         Store the extracted information into the vector database.
-        :param records: List of dictionaries containing the extracted information.
+        :param records: List of records (dicts or PubMedRecord) containing the extracted information.
         :param collection_name: Name of the collection to store in
         :return: True if successful, False otherwise
         """
@@ -109,11 +145,14 @@ class store_data:
                 print("No records to store.")
                 return False
 
+            embedder = get_embedder()
             client = chromadb.PersistentClient(path="./pumed")
             collection = client.get_or_create_collection(
                 name=collection_name,
-                metadata={"hnsw:space": "cosine"}
+                metadata=collection_metadata(collection_name, embedder.model_id)
             )
+            if not model_matches(collection, embedder.model_id):
+                return False
 
             ids = []
             documents = []
@@ -123,27 +162,11 @@ class store_data:
             
             for i, rec in enumerate(records):
                 try:
-                    # Generate a unique ID for each record
-                    pmid = rec.get('pmid', '')
-                    record_id = f"pubmed_{pmid}" if pmid else f"item_{i}_{hash(str(rec))}"
+                    record_id, document_text, metadata = self.build_entry(rec, i)
                     ids.append(record_id)
-
-                    # Create document text
-                    title = rec.get('title', 'No Title').strip()
-                    abstract_text = self.flatten_abstract(rec.get('abstract', {}))
-                    document_text = f"Title: {title}\n\nAbstract: {abstract_text}"
                     documents.append(document_text)
-
-                    # Create metadata with properly formatted authors
-                    metadata = {
-                        "title": title,
-                        "journal": rec.get('journal', 'Unknown Journal'),
-                        "authors": self.format_authors(rec.get('authors', [])),
-                        "publication_date": rec.get('publication_date', 'Unknown'),
-                        "pmid": pmid,
-                        "source": "pubmed"
-                    }
                     metadatas.append(metadata)
+                    title = metadata["title"]
                     
                     # Print progress for first few items
                     if i < 3:
@@ -154,12 +177,17 @@ class store_data:
                     print(f"⚠️ Error processing record {i}: {e}")
                     continue
 
-            # Add all records to collection
-            print(f"💾 Adding {len(documents)} records to ChromaDB collection '{collection_name}'...")
-            collection.add(
+            # Embed explicitly (batched, in parallel) instead of letting Chroma do it on one thread
+            embeddings = embedder.encode(documents)
+            print(f"🧠 Embedded {len(documents)} records ({embedder.stats()['docs_per_second']} docs/s overall)")
+
+            # Upsert so records that are already stored get refreshed instead of rejected
+            print(f"💾 Upserting {len(documents)} records to ChromaDB collection '{collection_name}'...")
+            collection.upsert(
                 ids=ids,
                 documents=documents,
-                metadatas=metadatas
+                metadatas=metadatas,
+                embeddings=embeddings
             )
             
             # Verify the insertion
@@ -173,27 +201,45 @@ class store_data:
             traceback.print_exc()
             return False
 
-    def run(self, collection_name: str = "pubmed_collection") -> bool:
+    def run(self, collection_name: str = "pubmed_collection", batch_size: int = 100, **pipeline_options) -> bool:
         """
         Execute the data fetching and storing pipeline.
+        Fetch, parse, embed and upsert run as overlapping stages (see
+        pipeline.IngestionPipeline), so memory stays flat regardless of topic size.
         :param collection_name: Name of collection to store in
+        :param batch_size: Number of PMIDs per batch
+        :param pipeline_options: Worker counts / queue size forwarded to IngestionPipeline
+        In incremental mode only PMIDs new or modified since the topic's last
+        checkpoint are fetched (see sync.PubMedSync).
         :return: True if successful, False otherwise
         """
         try:
+            if self.incremental:
+                from .sync import PubMedSync
+
+                summary = PubMedSync(
+                    self.search_topic,
+                    max_results=self.max_results,
+                    collection_name=collection_name,
+                    batch_size=batch_size,
+                    **pipeline_options
+                ).run()
+                return summary["failed"] == 0
+
             if not self.pmids:
                 print("🚨 No PubMed IDs available. Cannot fetch abstracts.")
                 return False
             
-            print(f"📥 Fetching abstracts for {len(self.pmids)} PubMed articles...")
-            abstracts = pb.fetch_pubmed_abstracts(self.pmids)
-            
-            if not abstracts:
+            from .pipeline import IngestionPipeline
+
+            pipeline = IngestionPipeline(collection_name=collection_name, batch_size=batch_size, **pipeline_options)
+            stats = pipeline.run(self.pmids)
+
+            if not stats["stored"]:
                 print("❌ No abstracts fetched from PubMed.")
                 return False
-            
-            print(f"📄 Fetched {len(abstracts)} abstracts. Storing in ChromaDB...")
-            success = self.stored_in_chroma(abstracts, collection_name)
-            return success
+
+            return all(stats[stage.name]["failed_batches"] == 0 for stage in pipeline.stages)
             
         except Exception as e:
             print(f"❌ Error in store_data.run(): {e}")
@@ -0,0 +1,354 @@
+import io
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import chromadb
+
+from embedding import get_embedder
+from hnsw_config import collection_metadata, model_matches
+
+from .dedup import NearDuplicateDetector
+from .fetch_data import store_data
+from .pubmed import PubMedRetriever as pb
+from .staging import StagingStore, collection_dir
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of the ingestion pipeline: a pool of worker threads pulling
+    batches from a bounded inbox, applying ``func`` and pushing the result
+    to the next stage. A full outbox blocks the workers (backpressure).
+    """
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        workers: int = 1,
+        retries: int = 2,
+        count: Callable[[Any, Any], int] = lambda batch, result: len(result)
+    ) -> None:
+        self.name = name
+        self.func = func
+        self.count = count
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.inbox: Optional[queue.Queue] = None
+        self.outbox: Optional[queue.Queue] = None
+        self.downstream_workers = 0
+        self.failed: List[Any] = []
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._alive = self.workers
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _call(self, batch: Any) -> Any:
+        # Retry only this batch; other batches keep flowing
+        for attempt in range(self.retries + 1):
+            try:
+                return self.func(batch)
+            except Exception as e:
+                print(f"⚠️ [{self.name}] attempt {attempt + 1} failed: {e}")
+                if attempt < self.retries:
+                    time.sleep(2 ** attempt)
+        raise RuntimeError(f"{self.name} gave up after {self.retries + 1} attempts")
+
+    def _work(self) -> None:
+        while True:
+            batch = self.inbox.get()
+            if batch is _DONE:
+                break
+            started = time.perf_counter()
+            try:
+                result = self._call(batch)
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                with self._lock:
+                    self.failed.append(batch)
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.busy_seconds += elapsed
+            with self._lock:
+                self.batches += 1
+                self.items += self.count(batch, result)
+            if self.outbox is not None and result:
+                self.outbox.put(result)
+
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last and self.outbox is not None:
+            for _ in range(self.downstream_workers):
+                self.outbox.put(_DONE)
+
+    def stats(self, wall_seconds: float) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "batches": self.batches,
+            "items": self.items,
+            "failed_batches": len(self.failed),
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items / wall_seconds, 2) if wall_seconds else 0.0,
+            # Rate a single worker sustains while busy; the lowest one is the bottleneck
+            "items_per_busy_second": round(self.items / self.busy_seconds, 2) if self.busy_seconds else 0.0
+        }
+
+
+class IngestionPipeline:
+    """
+    Staged PubMed ingestion: fetch -> parse -> embed -> upsert.
+    Stages are connected by bounded queues so network and CPU work overlap,
+    and a failing batch is retried (and, if needed, dropped) on its own.
+    """
+    def __init__(
+        self,
+        collection_name: str = "pubmed_collection",
+        path: str = "./pumed",
+        batch_size: int = 100,
+        fetch_workers: int = 3,
+        parse_workers: int = 2,
+        embed_workers: int = 2,
+        upsert_workers: int = 1,
+        queue_size: int = 4,
+        retries: int = 2,
+        extra_metadata: Optional[Callable[[str], Dict[str, Any]]] = None,
+        on_stored: Optional[Callable[[List[str]], None]] = None,
+        staging_dir: Optional[str] = "./pumed_staging",
+        dedup_threshold: Optional[float] = 0.85
+    ) -> None:
+        """
+        :param extra_metadata: optional pmid -> dict merged into each record's metadata
+        :param on_stored: optional callback receiving the ids of every upserted batch
+            (and of near-duplicates folded into an already indexed article)
+        :param staging_dir: staging root; records and vectors are staged under
+            ``<staging_dir>/<collection_name>`` for rebuilds (None disables)
+        :param dedup_threshold: MinHash similarity for near-duplicate abstracts (None disables)
+        """
+        staging_area = collection_dir(staging_dir, collection_name) if staging_dir else None
+        self.staging = StagingStore(staging_area) if staging_area else None
+        # The MinHash index lives with the collection's staging area: a representative only counts where it is indexed
+        self.dedup = NearDuplicateDetector(
+            threshold=dedup_threshold,
+            path=os.path.join(staging_area, "minhash.npz") if staging_area else None
+        ) if dedup_threshold else None
+        self.extra_metadata = extra_metadata
+        self.on_stored = on_stored
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.workers = {
+            "fetch": fetch_workers,
+            "parse": parse_workers,
+            "embed": embed_workers,
+            "upsert": upsert_workers
+        }
+        self.retries = retries
+        self.stages: List[Stage] = []
+        self.stored_ids: List[str] = []
+        self.deduplicated_ids: List[str] = []
+        # Dedup decisions are re-checked and committed together with the upsert
+        self._commit_lock = threading.Lock()
+
+        # Vectors are computed here and passed to Chroma explicitly
+        self.embedder = get_embedder()
+        client = chromadb.PersistentClient(path=path)
+        self.collection = client.get_or_create_collection(
+            name=collection_name,
+            metadata=collection_metadata(collection_name, self.embedder.model_id)
+        )
+        if not model_matches(self.collection, self.embedder.model_id):
+            raise ValueError(f"'{collection_name}' was built with another embedder; "
+                             f"set EMBED_BACKEND to match it or rebuild the collection")
+        if self.staging is not None and not self.staging.accepts(self.embedder.model_id):
+            # Checked up front: append would refuse every batch only after its upsert went through
+            print(f"⚠️ {staging_area} holds {self.staging.meta['model']} vectors, not {self.embedder.model_id}; "
+                  f"staging disabled for this pipeline (use another staging_dir for this model)")
+            self.staging = None
+
+    def build_stages(self) -> List[Stage]:
+        # Stages own their threads, so every run gets a fresh set
+        return [
+            Stage("fetch", self.fetch, self.workers["fetch"], self.retries, count=lambda batch, result: len(batch)),
+            Stage("parse", self.parse, self.workers["parse"], self.retries),
+            Stage("embed", self.embed, self.workers["embed"], self.retries, count=lambda batch, result: len(result.get("ids", []))),
+            Stage("upsert", self.upsert, self.workers["upsert"], self.retries)
+        ]
+
+    @staticmethod
+    def fetch(pmids: List[str]) -> bytes:
+        return pb.fetch_raw(pmids)
+
+    @staticmethod
+    def parse(raw: bytes) -> list:
+        return list(pb.iter_articles(io.BytesIO(raw)))
+
+    def embed(self, records: list) -> Dict[str, list]:
+        links, seen = {}, len(records)
+        if self.dedup is not None:
+            # Near-duplicates are never embedded; they are only recorded as such
+            # by the upsert stage, once their representative is stored
+            plan = self.dedup.plan(records)
+            records, links = plan["kept"], plan["links"]
+        ids, documents, metadatas = [], [], []
+        for i, rec in enumerate(records):
+            record_id, document_text, metadata = store_data.build_entry(rec, i)
+            if self.extra_metadata:
+                metadata.update(self.extra_metadata(metadata["pmid"]))
+            if self.dedup is not None:
+                duplicates = self.dedup.duplicates_of(metadata["pmid"])
+                if duplicates:
+                    metadata["duplicate_pmids"] = ", ".join(duplicates)
+            ids.append(record_id)
+            documents.append(document_text)
+            metadatas.append(metadata)
+        return {
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "embeddings": self.embedder.encode(documents),
+            "records": records,
+            "duplicates": links,
+            "seen": seen
+        }
+
+    def upsert(self, batch: Dict[str, Any]) -> list:
+        with self._commit_lock:
+            rows = list(zip(batch["ids"], batch["documents"], batch["metadatas"], batch["embeddings"], batch["records"]))
+            links = dict(batch.get("duplicates", {}))
+            signatures = {}
+            if self.dedup is not None:
+                # Representatives stored since the embed stage ran may cover some of these records
+                plan = self.dedup.plan(batch["records"])
+                rows = [row for row in rows if row[4].get("pmid") not in plan["links"]]
+                links.update(plan["links"])
+                links = {pmid: plan["links"].get(rep, rep) for pmid, rep in links.items()}
+                signatures = plan["signatures"]
+            ids = [row[0] for row in rows]
+            if rows:
+                _, documents, metadatas, embeddings, records = (list(column) for column in zip(*rows))
+                self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+                if self.staging is not None:
+                    self.staging.append(records, metadatas, embeddings, self.embedder.model_id)
+            # Only now are the representatives stored: the duplicates can be counted as done
+            if self.dedup is not None:
+                self.dedup.commit(links, signatures, seen=batch.get("seen", 0))
+            folded = [f"pubmed_{pmid}" for pmid in links]
+            self.stored_ids.extend(ids)
+            self.deduplicated_ids.extend(folded)
+        if self.on_stored:
+            self.on_stored(ids + folded)
+        return ids
+
+    def link_duplicates(self) -> None:
+        """
+        Record on each representative which PMIDs were folded into it during this run,
+        and persist the MinHash index for the next run.
+        """
+        changed = self.dedup.pop_changed()
+        if changed:
+            try:
+                self.collection.update(
+                    ids=[f"pubmed_{rep}" for rep in changed],
+                    metadatas=[{"duplicate_pmids": ", ".join(dups)} for dups in changed.values()]
+                )
+            except Exception as e:
+                print(f"⚠️ Could not link duplicates to their representatives: {e}")
+        self.dedup.save()
+
+    def run(self, pmids: List[str]) -> Dict[str, Any]:
+        """
+        Push every PMID through the pipeline and wait for it to drain.
+        :param pmids: list of PubMed IDs (PMIDs)
+        :return: per-stage statistics, plus the total number of stored records
+        """
+        print(f"🚚 Ingesting {len(pmids)} PMIDs in batches of {self.batch_size}...")
+        batches = (pmids[i:i + self.batch_size] for i in range(0, len(pmids), self.batch_size))
+        return self.drive(self.build_stages(), batches)
+
+    def run_records(self, records: Iterable[Any]) -> Dict[str, Any]:
+        """
+        Embed and upsert records that were parsed elsewhere (e.g. local baseline files),
+        skipping the fetch and parse stages.
+        :param records: iterable of PubMedRecord (or dicts), consumed lazily
+        :return: per-stage statistics, plus the total number of stored records
+        """
+        print(f"🚚 Ingesting parsed records in batches of {self.batch_size}...")
+        return self.drive(self.build_stages()[2:], self.chunked(records))
+
+    def chunked(self, items: Iterable[Any]) -> Iterator[list]:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def drive(self, stages: List[Stage], batches: Iterable[Any]) -> Dict[str, Any]:
+        """
+        Wire the stages together, feed the batches into the first one and wait for them to drain.
+        """
+        self.stages = stages
+        self.stored_ids = []
+        self.deduplicated_ids = []
+        source: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        inbox = source
+        for n, stage in enumerate(self.stages):
+            stage.inbox = inbox
+            if n + 1 < len(self.stages):
+                stage.outbox = queue.Queue(maxsize=self.queue_size)
+                stage.downstream_workers = self.stages[n + 1].workers
+                inbox = stage.outbox
+
+        started = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+
+        for batch in batches:
+            source.put(batch)  # blocks when the first stage is behind
+        for _ in range(self.stages[0].workers):
+            source.put(_DONE)
+
+        for stage in self.stages:
+            stage.join()
+        if self.dedup is not None:
+            self.link_duplicates()
+        wall = time.perf_counter() - started
+
+        stats = {stage.name: stage.stats(wall) for stage in self.stages}
+        stats["stored"] = self.stages[-1].items
+        stats["seconds"] = round(wall, 2)
+        for stage in self.stages:
+            s = stats[stage.name]
+            print(f"  {stage.name:<7} x{s['workers']}: {s['items']} items, "
+                  f"{s['items_per_second']}/s ({s['items_per_busy_second']}/s per worker), "
+                  f"busy {s['busy_seconds']}s, failed batches {s['failed_batches']}")
+        if self.dedup is not None:
+            stats["dedup"] = self.dedup.stats()
+            print(f"🧬 Near-duplicates: {stats['dedup']['duplicates']} of {stats['dedup']['seen']} "
+                  f"({stats['dedup']['dedup_ratio']:.1%}) in {stats['dedup']['clusters']} clusters")
+        stats["embedding"] = self.embedder.stats()
+        cache = stats["embedding"]["cache"]
+        print(f"🧠 Embedding: {stats['embedding']['docs_per_second']} docs/s ({stats['embedding']['model']})"
+              + (f", cache hit rate {cache['hit_rate']:.0%}" if cache else ""))
+        print(f"✅ Stored {stats['stored']} records in {stats['seconds']}s")
+        return stats
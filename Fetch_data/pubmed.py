@@ -1,94 +1,372 @@
-from time import sleep
+import io
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import date, timedelta
+from time import monotonic, sleep
 from xml.etree import ElementTree
 
 import requests
 
+from .cache import ResponseCache
+
+
+@dataclass(slots=True)
+class PubMedRecord:
+    '''
+    Compact per-article record produced by the PubMed parsers.
+    Supports dict-style ``get`` so existing consumers keep working.
+    '''
+    pmid: str
+    title: str
+    abstract: dict
+    journal: str
+    authors: str
+    publication_date: str
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> dict:
+        return {
+            "pmid": self.pmid,
+            "title": self.title,
+            "abstract": self.abstract,
+            "journal": self.journal,
+            "authors": self.authors,
+            "publication_date": self.publication_date
+        }
+
+
+class RateLimiter:
+    '''
+    Thread-safe limiter spacing out calls to at most ``rate`` per second.
+    NCBI allows 3 requests/second without an API key (10 with one).
+    '''
+    def __init__(self, rate: float = 3.0) -> None:
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            sleep(slot - now)
+
+
+def _parse_date(value: str) -> date:
+    # E-utilities accept YYYY, YYYY/MM or YYYY/MM/DD
+    parts = [int(p) for p in str(value).split("/")]
+    return date(*(parts + [1, 1])[:3])
+
+
+def _format_date(value: date) -> str:
+    return value.strftime("%Y/%m/%d")
+
 
 class PubMedRetriever:
     SEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
     FETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+    # Shared by every thread talking to E-utilities
+    rate_limiter = RateLimiter()
+    # Optional raw response cache, see configure_cache
+    cache = None
+    # esearch never returns records past this offset for a single query
+    ESEARCH_CAP = 9999
+
+    @staticmethod
+    def configure_cache(directory: str = "./pubmed_cache", ttl_seconds: float = 30 * 86400, offline: bool = False) -> ResponseCache:
+        '''
+        Enable the on-disk cache of raw esearch/efetch responses.
+        With offline=True nothing goes to the network: requests are replayed
+        from the cache and unknown ones raise CacheMiss.
+        :param directory: cache directory
+        :param ttl_seconds: age after which an entry is re-fetched (ignored offline)
+        :param offline: serve only from the cache
+        :return: the configured ResponseCache
+        '''
+        PubMedRetriever.cache = ResponseCache(directory, ttl_seconds=ttl_seconds, offline=offline)
+        return PubMedRetriever.cache
+
+    @staticmethod
+    def get_raw(url: str, params: dict) -> bytes:
+        '''
+        Perform one E-utilities GET, going through the cache when configured.
+        :param url: SEARCH_URL or FETCH_URL
+        :param params: query parameters
+        :return: response body as bytes
+        '''
+        cache = PubMedRetriever.cache
+        if cache is not None:
+            body = cache.get(url, params)
+            if body is not None:
+                return body
+
+        PubMedRetriever.rate_limiter.wait()
+        response = requests.get(url, params=params)
+        response.raise_for_status()
+        if cache is not None:
+            cache.put(url, params, response.content)
+        return response.content
 
     @staticmethod
-    def search_pubmed_articles(search_term, max_results=100) -> list:
+    def search_pubmed_articles(search_term, max_results=100, **filters) -> list:
         '''
         Search the artical on thbasis of given term like similar to keyword search
         and return list of PubMed IDs (PMIDs).
+        esearch stops at 9,999 records per query; bigger result sets are
+        enumerated by publication-date windows (see search_by_date_windows).
+
+        :param search_term: keyword to search articles
+        :param max_results: maximum number of results to retrieve, None for every match
+        :param filters: extra esearch parameters, e.g. datetype='mdat', mindate='2024/01/01',
+            maxdate='2024/12/31' or reldate=7
+        :return: list of PubMed IDs (PMIDs)
+        '''
+        # Size the result set first (no IDs listed), then choose one query or date windows
+        total = PubMedRetriever.count_pubmed_articles(search_term, **filters)
+        wanted = total if max_results is None else min(max_results, total)
+        if wanted > PubMedRetriever.ESEARCH_CAP:
+            if 'reldate' in filters:
+                print(f"⚠️ '{search_term}' has {total} results; only the first "
+                      f"{PubMedRetriever.ESEARCH_CAP} are reachable with reldate, use mindate/maxdate instead")
+            else:
+                return PubMedRetriever.search_by_date_windows(
+                    search_term,
+                    max_results=max_results,
+                    datetype=filters.get('datetype', 'pdat'),
+                    mindate=filters.get('mindate'),
+                    maxdate=filters.get('maxdate'),
+                    **{k: v for k, v in filters.items() if k not in ('datetype', 'mindate', 'maxdate')}
+                )
+        return PubMedRetriever.list_ids(search_term, min(wanted, PubMedRetriever.ESEARCH_CAP), **filters)
 
+    @staticmethod
+    def list_ids(search_term, count, **filters) -> list:
+        '''
+        Page through the first ``count`` PMIDs of a query whose size is already known.
         :param search_term: keyword to search articles
-        :param max_results: maximum number of results to retrieve
+        :param count: number of PMIDs to list, at most ESEARCH_CAP
+        :param filters: extra esearch parameters
         :return: list of PubMed IDs (PMIDs)
         '''
         params = {
             'db': 'pubmed',
             'term': search_term,
-            'retmax': 100,
-            'retmode': 'xml'
+            'retmode': 'xml',
+            **filters
         }
-
         pmid_list = []
         start = 0
-        while len(pmid_list) < max_results:
+        while start < count:
             params['retstart'] = start
-            response = requests.get(PubMedRetriever.SEARCH_URL, params=params)
-            root = ElementTree.fromstring(response.content)
+            params['retmax'] = count - start
+            # Rate limited to avoid overwhelming the server
+            content = PubMedRetriever.get_raw(PubMedRetriever.SEARCH_URL, params)
+            root = ElementTree.fromstring(content)
             ids = [id_elem.text for id_elem in root.findall(".//Id")]
             if not ids:
                 break
             pmid_list.extend(ids)
-            start += 100
-            sleep(1)  # Avoid overwhelming the server
+            start += len(ids)
+        return pmid_list[:count]
 
-        return pmid_list[:max_results]
+    @staticmethod
+    def count_pubmed_articles(search_term, **filters) -> int:
+        '''
+        Number of records matching a query, without retrieving any IDs.
+        :param search_term: keyword to search articles
+        :param filters: extra esearch parameters (datetype, mindate, maxdate, ...)
+        :return: total hit count
+        '''
+        params = {
+            'db': 'pubmed',
+            'term': search_term,
+            'rettype': 'count',
+            'retmode': 'xml',
+            **filters
+        }
+        root = ElementTree.fromstring(PubMedRetriever.get_raw(PubMedRetriever.SEARCH_URL, params))
+        return int(root.findtext("Count") or 0)
 
     @staticmethod
-    def fetch_pubmed_abstracts(pmid_list) -> list:
+    def search_by_date_windows(search_term, max_results=None, datetype='pdat', mindate=None, maxdate=None,
+                               max_workers: int = 3, **filters) -> list:
         '''
-        Fetch abstracts and metadata for a list of PubMed IDs (PMIDs).
-        :param pmid_list: list of PubMed IDs (PMIDs)
-        :return: list of dictionaries containing article metadata and abstracts
+        Enumerate every PMID of a query by splitting it into date windows.
+        A window whose count exceeds the esearch cap is halved until each
+        piece fits; windows are counted and listed concurrently (under the
+        shared rate limiter) and the PMIDs merged without duplicates.
+
+        :param search_term: keyword to search articles
+        :param max_results: optional cap on the merged result
+        :param datetype: 'pdat' (publication), 'edat' (entrez) or 'mdat' (modification) date
+        :param mindate: first day as YYYY/MM/DD (default 1800/01/01)
+        :param maxdate: last day as YYYY/MM/DD (default today)
+        :param max_workers: concurrent esearch calls
+        :param filters: extra esearch parameters
+        :return: list of PubMed IDs (PMIDs)
+        '''
+        first = _parse_date(mindate) if mindate else date(1800, 1, 1)
+        last = _parse_date(maxdate) if maxdate else date.today()
+        cap = PubMedRetriever.ESEARCH_CAP
+
+        def window_filters(lo, hi):
+            return {**filters, 'datetype': datetype, 'mindate': _format_date(lo), 'maxdate': _format_date(hi)}
+
+        def visit(window):
+            # Returns either sub-windows to explore or the PMIDs of this window
+            lo, hi = window
+            count = PubMedRetriever.count_pubmed_articles(search_term, **window_filters(lo, hi))
+            if count > cap and lo < hi:
+                mid = lo + (hi - lo) // 2
+                return [(lo, mid), (mid + timedelta(days=1), hi)], []
+            if count > cap:
+                print(f"⚠️ {_format_date(lo)} alone has {count} results; keeping the first {cap}")
+            wanted = min(count, cap)
+            if max_results:
+                # Other windows may already have filled most of the cap
+                wanted = min(wanted, max_results - len(merged))
+            if wanted <= 0:
+                return [], []
+            return [], PubMedRetriever.list_ids(search_term, wanted, **window_filters(lo, hi))
+
+        merged = {}
+        windows = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {executor.submit(visit, (first, last))}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    children, pmids = future.result()
+                    if pmids:
+                        windows += 1
+                        merged.update(dict.fromkeys(pmids))
+                    if max_results and len(merged) >= max_results:
+                        # Enough PMIDs: drop the windows not started yet, let running ones finish
+                        for other in pending:
+                            other.cancel()
+                        continue
+                    for child in children:
+                        pending.add(executor.submit(visit, child))
+
+        print(f"🗓️ '{search_term}': {len(merged)} PMIDs from {windows} date windows")
+        pmid_list = list(merged)
+        return pmid_list[:max_results] if max_results else pmid_list
+
+    @staticmethod
+    def parse_article(article) -> PubMedRecord:
+        '''
+        Build a compact record from a single <PubmedArticle> element.
+        :param article: parsed PubmedArticle element
+        :return: PubMedRecord with the article metadata and abstract
         '''
+        pmid = article.find(".//PMID").text
+        title = article.find(".//ArticleTitle").text if article.find(
+            ".//ArticleTitle") is not None else "No Title"
+
+        # Process abstract sections into a dictionary
+        abstract_sections = article.findall(".//AbstractText")
+        abstract = {
+            section.attrib.get('Label', 'SUMMARY'): section.text
+            for section in abstract_sections if section.text is not None
+        } if abstract_sections else {"SUMMARY": "No Abstract"}
+
+        journal = article.find(".//Journal/Title").text if article.find(
+            ".//Journal/Title") is not None else "Unknown Journal"
+        pub_date = article.find(".//PubDate/Year").text if article.find(
+            ".//PubDate/Year") is not None else "Unknown Year"
 
-        abstracts = []
+        authors = [
+            f"{author.find('.//ForeName').text} {author.find('.//LastName').text}"
+            for author in article.findall(".//Author")
+            if author.find(".//ForeName") is not None and author.find(".//LastName") is not None
+        ]
+
+        return PubMedRecord(
+            pmid=pmid,
+            title=title,
+            abstract=abstract,
+            journal=journal,
+            authors=", ".join(authors) if authors else "No Authors",
+            publication_date=pub_date
+        )
+
+    @staticmethod
+    def iter_articles(source, keep=None):
+        '''
+        Incrementally parse an efetch XML stream and yield one record per article.
+        Each <PubmedArticle> is cleared once parsed so memory stays flat.
+        :param source: file-like object (or path) containing PubMed XML
+        :param keep: optional predicate on the PubmedArticle element; articles it rejects are skipped
+        :return: generator of PubMedRecord
+        '''
+        root = None
+        for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == "PubmedArticle":
+                if keep is None or keep(elem):
+                    yield PubMedRetriever.parse_article(elem)
+                elem.clear()
+                # Drop the (now empty) children still referenced by the root element
+                root.clear()
 
-        for i in range(0, len(pmid_list), 100):
+    @staticmethod
+    def iter_pubmed_abstracts(pmid_list, batch_size: int = 100):
+        '''
+        Stream abstracts and metadata for a list of PubMed IDs (PMIDs).
+        Records are yielded as the efetch response bytes arrive instead of
+        being collected into one list.
+        :param pmid_list: list of PubMed IDs (PMIDs)
+        :param batch_size: number of PMIDs requested per efetch call
+        :return: generator of PubMedRecord
+        '''
+        for i in range(0, len(pmid_list), batch_size):
             fetch_params = {
                 'db': 'pubmed',
-                'id': ','.join(pmid_list[i:i + 100]),
+                'id': ','.join(pmid_list[i:i + batch_size]),
                 'retmode': 'xml'
             }
-            fetch_response = requests.get(PubMedRetriever.FETCH_URL, params=fetch_params)
-            fetch_root = ElementTree.fromstring(fetch_response.content)
-
-            for article in fetch_root.findall(".//PubmedArticle"):
-                pmid = article.find(".//PMID").text
-                title = article.find(".//ArticleTitle").text if article.find(
-                    ".//ArticleTitle") is not None else "No Title"
-
-                # Process abstract sections into a dictionary
-                abstract_sections = article.findall(".//AbstractText")
-                abstract = {
-                    section.attrib.get('Label', 'SUMMARY'): section.text
-                    for section in abstract_sections if section.text is not None
-                } if abstract_sections else {"SUMMARY": "No Abstract"}
-
-                journal = article.find(".//Journal/Title").text if article.find(
-                    ".//Journal/Title") is not None else "Unknown Journal"
-                pub_date = article.find(".//PubDate/Year").text if article.find(
-                    ".//PubDate/Year") is not None else "Unknown Year"
-
-                authors = [
-                    f"{author.find('.//ForeName').text} {author.find('.//LastName').text}"
-                    for author in article.findall(".//Author")
-                    if author.find(".//ForeName") is not None and author.find(".//LastName") is not None
-                ]
-
-                abstracts.append({
-                    "pmid": pmid,
-                    "title": title,
-                    "abstract": abstract,
-                    "journal": journal,
-                    "authors": ", ".join(authors) if authors else "No Authors",
-                    "publication_date": pub_date
-                })
-        print(abstracts)
-        return abstracts
+            if PubMedRetriever.cache is not None:
+                # Cached bodies are already complete; parse them from memory
+                raw = PubMedRetriever.get_raw(PubMedRetriever.FETCH_URL, fetch_params)
+                yield from PubMedRetriever.iter_articles(io.BytesIO(raw))
+                continue
+
+            PubMedRetriever.rate_limiter.wait()
+            with requests.get(PubMedRetriever.FETCH_URL, params=fetch_params, stream=True) as fetch_response:
+                fetch_response.raise_for_status()
+                fetch_response.raw.decode_content = True
+                yield from PubMedRetriever.iter_articles(fetch_response.raw)
+
+    @staticmethod
+    def fetch_raw(pmid_list) -> bytes:
+        '''
+        Download the raw efetch XML for one batch of PubMed IDs.
+        :param pmid_list: list of PubMed IDs (PMIDs), at most a few hundred
+        :return: response body as bytes
+        '''
+        fetch_params = {
+            'db': 'pubmed',
+            'id': ','.join(pmid_list),
+            'retmode': 'xml'
+        }
+        return PubMedRetriever.get_raw(PubMedRetriever.FETCH_URL, fetch_params)
+
+    @staticmethod
+    def fetch_pubmed_abstracts(pmid_list) -> list:
+        '''
+        Fetch abstracts and metadata for a list of PubMed IDs (PMIDs).
+        Prefer iter_pubmed_abstracts (compact PubMedRecord objects) for large PMID lists.
+        :param pmid_list: list of PubMed IDs (PMIDs)
+        :return: list of dictionaries containing article metadata and abstracts
+        '''
+        return [record.to_dict() for record in PubMedRetriever.iter_pubmed_abstracts(pmid_list)]
@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .pipeline import IngestionPipeline
+from .pubmed import PubMedRetriever as pb
+
+# Topics covered by the assistant (see LargeLanguageModel.generate_response)
+DEFAULT_MANIFEST = [
+    {"topic": "Cancer", "query": "Cancer", "max_results": 500},
+    {"topic": "Diabetes", "query": "Diabetes", "max_results": 500},
+    {"topic": "Cardiology", "query": "Cardiology OR cardiovascular disease", "max_results": 500}
+]
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """
+    Load a topic manifest: a JSON list of {"topic", "query", "max_results"} objects.
+    ``query`` defaults to the topic name.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    for entry in manifest:
+        entry.setdefault("query", entry["topic"])
+        entry.setdefault("max_results", 100)
+    return manifest
+
+
+class TopicScheduler:
+    """
+    Ingest several topics at once through one shared pipeline.
+    Searches run concurrently (all E-utilities calls share
+    PubMedRetriever.rate_limiter), PMIDs found under several topics are
+    fetched and embedded once, and progress/ETA is reported per topic.
+    """
+    def __init__(
+        self,
+        manifest: Optional[List[Dict[str, Any]]] = None,
+        collection_name: str = "pubmed_collection",
+        batch_size: int = 100,
+        search_workers: int = 3,
+        **pipeline_options
+    ) -> None:
+        self.manifest = manifest or DEFAULT_MANIFEST
+        self.batch_size = batch_size
+        self.search_workers = search_workers
+        self.topics_by_pmid: Dict[str, List[str]] = {}
+        self.owner: Dict[str, str] = {}
+        self.progress: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.pipeline = IngestionPipeline(
+            collection_name=collection_name,
+            batch_size=batch_size,
+            extra_metadata=lambda pmid: {"topics": ", ".join(self.topics_by_pmid.get(pmid, []))},
+            on_stored=self.report,
+            **pipeline_options
+        )
+
+    def search_all(self) -> Dict[str, List[str]]:
+        """
+        Run every topic's esearch concurrently.
+        :return: topic -> PMIDs
+        """
+        def search(entry):
+            pmids = pb.search_pubmed_articles(entry["query"], max_results=entry["max_results"])
+            print(f"🔍 [{entry['topic']}] {len(pmids)} PMIDs")
+            return entry["topic"], pmids
+
+        with ThreadPoolExecutor(max_workers=self.search_workers) as executor:
+            return dict(executor.map(search, self.manifest))
+
+    def plan(self, results: Dict[str, List[str]]) -> List[str]:
+        """
+        De-duplicate PMIDs across topics and interleave the topics batch by batch.
+        Each PMID is owned by the first topic (in manifest order) that found it.
+        :param results: topic -> PMIDs
+        :return: ordered list of unique PMIDs to ingest
+        """
+        existing = {i[len("pubmed_"):] for i in self.pipeline.collection.get(include=[])["ids"]}
+        owned: Dict[str, List[str]] = {}
+        for entry in self.manifest:
+            topic = entry["topic"]
+            owned[topic] = []
+            for pmid in results.get(topic, []):
+                topics = self.topics_by_pmid.setdefault(pmid, [])
+                if topic not in topics:
+                    topics.append(topic)
+                if pmid not in self.owner:
+                    self.owner[pmid] = topic
+                    if pmid not in existing:
+                        owned[topic].append(pmid)
+
+        total_found = sum(len(p) for p in results.values())
+        unique = sum(len(p) for p in owned.values())
+        print(f"🧮 {total_found} PMIDs found, {len(self.owner)} unique, {unique} not yet stored")
+
+        now = time.perf_counter()
+        for topic, pmids in owned.items():
+            self.progress[topic] = {"total": len(pmids), "done": 0, "started": now}
+
+        # Round-robin the topics so they all make progress at the same time
+        order = []
+        chunks = {t: [p[i:i + self.batch_size] for i in range(0, len(p), self.batch_size)] for t, p in owned.items()}
+        while any(chunks.values()):
+            for topic in list(chunks):
+                if chunks[topic]:
+                    order.extend(chunks[topic].pop(0))
+        return order
+
+    def report(self, ids: List[str]) -> None:
+        with self._lock:
+            touched = set()
+            for record_id in ids:
+                topic = self.owner.get(record_id[len("pubmed_"):])
+                if topic in self.progress:
+                    self.progress[topic]["done"] += 1
+                    touched.add(topic)
+            for topic in touched:
+                p = self.progress[topic]
+                elapsed = time.perf_counter() - p["started"]
+                remaining = p["total"] - p["done"]
+                eta = remaining * elapsed / p["done"] if p["done"] else 0.0
+                percent = 100 * p["done"] / p["total"] if p["total"] else 100
+                print(f"  [{topic}] {p['done']}/{p['total']} ({percent:.0f}%) ETA {eta:.0f}s")
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Search, de-duplicate and ingest all topics of the manifest.
+        :return: per-topic progress plus the pipeline statistics
+        """
+        order = self.plan(self.search_all())
+        if not order:
+            print("✅ Nothing new to ingest.")
+            return {"topics": self.progress, "pipeline": {}}
+        stats = self.pipeline.run(order)
+        return {"topics": self.progress, "pipeline": stats}
@@ -0,0 +1,284 @@
+"""
+Versioned, checksummed snapshots of a ChromaDB collection for cold-starting
+new nodes without PubMed or re-embedding.
+
+Usage:
+    python -m Fetch_data.snapshot export --path ./pumed --collection pubmed_collection --out snapshots/pubmed
+    python -m Fetch_data.snapshot import snapshots/pubmed --to chroma_db --reset
+    python -m Fetch_data.snapshot verify snapshots/pubmed
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+FORMAT = "medichat-collection-snapshot"
+VERSION = 1
+RECORDS_FILE = "records.jsonl.gz"
+VECTORS_FILE = "vectors.f32"
+MANIFEST_FILE = "manifest.json"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class _HashingWriter:
+    # File wrapper hashing bytes as they are written, so export is single-pass
+    def __init__(self, path: str) -> None:
+        self.file = open(path, "wb")
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.file.write(data)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def digest(self) -> Dict[str, Any]:
+        return {"sha256": self.sha256.hexdigest(), "bytes": self.bytes}
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> Dict[str, Any]:
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+    return {"sha256": sha256.hexdigest(), "bytes": size}
+
+
+def export_collection(
+    collection_name: str,
+    out_dir: str,
+    path: str = "./pumed",
+    batch_size: int = 1000,
+    model: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Stream a collection to a snapshot directory, one page at a time.
+    :param collection_name: collection to export
+    :param out_dir: snapshot directory to create (must not exist)
+    :param path: ChromaDB directory holding the collection
+    :param batch_size: rows fetched per page
+    :param model: embedding model id recorded in the manifest
+    :return: the manifest
+    """
+    import chromadb
+
+    if os.path.exists(out_dir):
+        raise SnapshotError(f"{out_dir} already exists")
+    collection = chromadb.PersistentClient(path=path).get_collection(name=collection_name)
+    total = collection.count()
+
+    # Written next to the target and renamed at the end: a snapshot directory is always complete
+    tmp_dir = out_dir.rstrip("/\\") + ".partial"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    records_raw = _HashingWriter(os.path.join(tmp_dir, RECORDS_FILE))
+    vectors_out = _HashingWriter(os.path.join(tmp_dir, VECTORS_FILE))
+    dim = None
+    count = 0
+    print(f"📤 Exporting '{collection_name}' ({total} records) from {path}...")
+    try:
+        with gzip.GzipFile(fileobj=records_raw, mode="wb", mtime=0) as records_out:
+            for offset in range(0, total, batch_size):
+                page = collection.get(
+                    limit=batch_size,
+                    offset=offset,
+                    include=["documents", "metadatas", "embeddings"]
+                )
+                if not len(page["ids"]):
+                    break
+                block = np.asarray(page["embeddings"], dtype=np.float32)
+                if dim is None:
+                    dim = int(block.shape[1])
+                lines = "".join(
+                    json.dumps({"id": i, "document": d, "metadata": m}, ensure_ascii=False) + "\n"
+                    for i, d, m in zip(page["ids"], page["documents"], page["metadatas"])
+                )
+                records_out.write(lines.encode("utf-8"))
+                vectors_out.write(block.tobytes())
+                count += len(page["ids"])
+    finally:
+        records_raw.close()
+        vectors_out.close()
+
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "collection": collection_name,
+        "collection_metadata": collection.metadata or {},
+        "model": model,
+        "dim": dim,
+        "count": count,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "files": {RECORDS_FILE: records_raw.digest(), VECTORS_FILE: vectors_out.digest()}
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_dir, out_dir)
+    print(f"✅ Snapshot written to {out_dir}: {count} records, "
+          f"{sum(v['bytes'] for v in manifest['files'].values()) / 2 ** 20:.1f} MB")
+    return manifest
+
+
+def read_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT:
+        raise SnapshotError(f"{snapshot_dir} is not a collection snapshot")
+    if manifest.get("version", 0) > VERSION:
+        raise SnapshotError(f"Snapshot version {manifest['version']} is newer than supported ({VERSION})")
+    return manifest
+
+
+def verify_snapshot(snapshot_dir: str) -> Dict[str, Any]:
+    """
+    Check every file against the manifest checksums.
+    :return: the manifest
+    :raises SnapshotError: on a missing, truncated or corrupted file
+    """
+    manifest = read_manifest(snapshot_dir)
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(snapshot_dir, name)
+        if not os.path.exists(file_path):
+            raise SnapshotError(f"{name} is missing from {snapshot_dir}")
+        if file_digest(file_path) != expected:
+            raise SnapshotError(f"{name} does not match its checksum")
+    if manifest["count"] and os.path.getsize(os.path.join(snapshot_dir, VECTORS_FILE)) != 4 * manifest["dim"] * manifest["count"]:
+        raise SnapshotError(f"{VECTORS_FILE} does not hold {manifest['count']} vectors of dim {manifest['dim']}")
+    return manifest
+
+
+def iter_snapshot(snapshot_dir: str, manifest: Dict[str, Any], batch_size: int = 1000) -> Iterator[Dict[str, list]]:
+    """
+    Stream the snapshot as upsert-ready batches.
+    """
+    if not manifest["count"]:
+        return
+    vectors = np.memmap(
+        os.path.join(snapshot_dir, VECTORS_FILE),
+        dtype=np.float32,
+        mode="r",
+        shape=(manifest["count"], manifest["dim"])
+    )
+    batch: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": []}
+    start = 0
+    with gzip.open(os.path.join(snapshot_dir, RECORDS_FILE), "rt", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            batch["ids"].append(row["id"])
+            batch["documents"].append(row["document"])
+            batch["metadatas"].append(row["metadata"])
+            if len(batch["ids"]) >= batch_size:
+                end = start + len(batch["ids"])
+                yield {**batch, "embeddings": np.asarray(vectors[start:end])}
+                start = end
+                batch = {"ids": [], "documents": [], "metadatas": []}
+    if batch["ids"]:
+        yield {**batch, "embeddings": np.asarray(vectors[start:start + len(batch["ids"])])}
+
+
+def import_snapshot(
+    snapshot_dir: str,
+    path: str = "chroma_db",
+    collection_name: Optional[str] = None,
+    reset: bool = False,
+    batch_size: int = 1000,
+    model: Optional[str] = None
+) -> int:
+    """
+    Bulk-load a snapshot into a ChromaDB directory, using the stored vectors.
+    :param snapshot_dir: snapshot directory
+    :param path: target ChromaDB directory
+    :param collection_name: target collection (default: the exported one)
+    :param reset: drop the target collection first
+    :param batch_size: rows per upsert
+    :param model: embedding model id the node serves with; refused if the snapshot used another
+    :return: number of records loaded
+    """
+    import chromadb
+
+    manifest = verify_snapshot(snapshot_dir)
+    if model and manifest.get("model") and manifest["model"] != model:
+        raise SnapshotError(f"Snapshot vectors come from {manifest['model']}, not {model}")
+    collection_name = collection_name or manifest["collection"]
+
+    client = chromadb.PersistentClient(path=path)
+    if reset:
+        try:
+            client.delete_collection(name=collection_name)
+        except Exception:
+            pass
+    # The exported metadata carries the source collection's HNSW settings
+    collection = client.get_or_create_collection(
+        name=collection_name,
+        metadata=manifest["collection_metadata"] or {"hnsw:space": "cosine"}
+    )
+
+    print(f"📥 Importing {manifest['count']} records into '{collection_name}' at {path}...")
+    started = time.perf_counter()
+    loaded = 0
+    for batch in iter_snapshot(snapshot_dir, manifest, batch_size):
+        collection.upsert(**batch)
+        loaded += len(batch["ids"])
+    elapsed = time.perf_counter() - started
+    print(f"✅ Loaded {loaded} records in {elapsed:.1f}s ({loaded / elapsed if elapsed else 0:.0f} records/s)")
+    return loaded
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export, verify or import collection snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export")
+    export.add_argument("--path", default="./pumed", help="ChromaDB directory to read")
+    export.add_argument("--collection", default="pubmed_collection")
+    export.add_argument("--out", required=True, help="snapshot directory to create")
+    export.add_argument("--model", help="embedding model id to record")
+    export.add_argument("--batch-size", type=int, default=1000)
+
+    verify = sub.add_parser("verify")
+    verify.add_argument("snapshot")
+
+    load = sub.add_parser("import")
+    load.add_argument("snapshot")
+    load.add_argument("--to", default="chroma_db", help="ChromaDB directory to load into")
+    load.add_argument("--collection", help="target collection (default: the exported one)")
+    load.add_argument("--model", help="refuse snapshots embedded with a different model")
+    load.add_argument("--reset", action="store_true", help="drop the target collection first")
+    load.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_collection(args.collection, args.out, path=args.path, batch_size=args.batch_size, model=args.model)
+    elif args.command == "verify":
+        manifest = verify_snapshot(args.snapshot)
+        print(f"✅ {args.snapshot}: {manifest['count']} records of '{manifest['collection']}', checksums OK")
+    else:
+        import_snapshot(
+            args.snapshot,
+            path=args.to,
+            collection_name=args.collection,
+            reset=args.reset,
+            batch_size=args.batch_size,
+            model=args.model
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Staging copy of everything ingested, independent of the vector index.
+
+Usage:
+    python -m Fetch_data.staging rebuild --collection pubmed_collection --reset
+    python -m Fetch_data.staging stats
+"""
+import argparse
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from hnsw_config import collection_metadata, model_matches
+
+from .fetch_data import store_data
+
+# Metadata keys derived from the record itself; anything else is kept as "extra"
+_RECORD_KEYS = {"title", "journal", "authors", "publication_date", "pmid", "source"}
+
+
+def collection_dir(root: str, collection_name: str) -> str:
+    """
+    :return: staging area of one collection under the staging root
+    """
+    return os.path.join(root, collection_name)
+
+
+class StagingStore:
+    """
+    Append-only staging area written during ingestion.
+
+    ``records.jsonl`` holds one compact row per record (pmid, title,
+    sections, journal, year, authors, plus extra metadata) and
+    ``vectors.f32`` the matching float32 embeddings, row i of one aligned
+    with line i of the other. ``meta.json`` records the embedding model and
+    dimension. Any collection can be rebuilt from it without PubMed or
+    re-embedding.
+
+    Each collection stages into its own area, ``<root>/<collection>`` (see
+    collection_dir), so a rebuild only ever replays that collection's rows.
+    """
+    def __init__(self, directory: str = "./pumed_staging") -> None:
+        self.directory = directory
+        self.records_path = os.path.join(directory, "records.jsonl")
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.meta: Dict[str, Any] = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        self.rows = self._recover()
+
+    def _recover(self) -> int:
+        """
+        Make both files end on the same row after a crash mid-append.
+        :return: number of complete rows
+        """
+        if not self.meta.get("dim") or not os.path.exists(self.records_path):
+            return 0
+        row_bytes = 4 * self.meta["dim"]
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+
+        offsets = []
+        with open(self.records_path, "rb") as f:
+            position = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                offsets.append(position)
+        rows = min(len(offsets), vector_rows)
+
+        with open(self.records_path, "r+b") as f:
+            f.truncate(offsets[rows - 1] if rows else 0)
+        if os.path.exists(self.vectors_path):
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(rows * row_bytes)
+        return rows
+
+    @staticmethod
+    def to_row(record: Any, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        row = {
+            "pmid": record.get("pmid", ""),
+            "title": record.get("title"),
+            "sections": record.get("abstract", {}),
+            "journal": record.get("journal"),
+            "year": record.get("publication_date"),
+            "authors": record.get("authors")
+        }
+        extra = {k: v for k, v in metadata.items() if k not in _RECORD_KEYS}
+        if extra:
+            row["extra"] = extra
+        return row
+
+    @staticmethod
+    def from_row(row: Dict[str, Any], index: int = 0) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        Rebuild the (id, document, metadata) triple exactly as ingestion produced it.
+        """
+        record = {
+            "pmid": row["pmid"],
+            "title": row["title"],
+            "abstract": row["sections"],
+            "journal": row["journal"],
+            "publication_date": row["year"],
+            "authors": row["authors"]
+        }
+        record_id, document_text, metadata = store_data.build_entry(record, index)
+        metadata.update(row.get("extra", {}))
+        return record_id, document_text, metadata
+
+    def accepts(self, model_id: str) -> bool:
+        """
+        :return: False if the area already holds vectors of another model
+        """
+        return not self.meta or self.meta.get("model") == model_id
+
+    def append(self, records: List[Any], metadatas: List[Dict[str, Any]], embeddings: List[List[float]], model_id: str) -> None:
+        block = np.asarray(embeddings, dtype=np.float32)
+        lines = "".join(json.dumps(self.to_row(r, m), ensure_ascii=False) + "\n" for r, m in zip(records, metadatas))
+        with self._lock:
+            if not self.meta:
+                self.meta = {"model": model_id, "dim": int(block.shape[1])}
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump(self.meta, f)
+            elif self.meta["model"] != model_id or self.meta["dim"] != block.shape[1]:
+                raise ValueError(f"Staging area holds {self.meta['model']} vectors, refusing {model_id}")
+            with open(self.vectors_path, "ab") as f:
+                f.write(block.tobytes())
+            with open(self.records_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self.rows += len(records)
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[Dict[str, list]]:
+        """
+        Stream the staged rows as upsert-ready batches. When a PMID was staged
+        several times, the later row wins (same as the original upserts).
+        """
+        if not self.rows:
+            return
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.meta["dim"]))
+        batch: Dict[str, Any] = {}
+        with open(self.records_path, "r", encoding="utf-8") as f:
+            for index, line in enumerate(f):
+                if index >= self.rows:
+                    break
+                record_id, document_text, metadata = self.from_row(json.loads(line), index)
+                # Re-inserting moves a duplicate id to the end, keeping the newest row only
+                batch.pop(record_id, None)
+                batch[record_id] = (document_text, metadata, vectors[index])
+                if len(batch) >= batch_size:
+                    yield self._as_upsert(batch)
+                    batch = {}
+        if batch:
+            yield self._as_upsert(batch)
+
+    @staticmethod
+    def _as_upsert(batch: Dict[str, tuple]) -> Dict[str, list]:
+        return {
+            "ids": list(batch),
+            "documents": [doc for doc, _, _ in batch.values()],
+            "metadatas": [meta for _, meta, _ in batch.values()],
+            "embeddings": np.asarray([vec for _, _, vec in batch.values()], dtype=np.float32)
+        }
+
+    def rebuild(
+        self,
+        collection_name: str = "pubmed_collection",
+        path: str = "./pumed",
+        metadata: Optional[Dict[str, Any]] = None,
+        reset: bool = False,
+        batch_size: int = 1000
+    ) -> int:
+        """
+        Regenerate a ChromaDB collection from staging, at disk speed.
+        :param collection_name: collection to (re)create
+        :param path: ChromaDB directory
+        :param metadata: collection metadata (default: cosine space plus tuned HNSW parameters)
+        :param reset: drop the collection first so new index settings take effect
+        :param batch_size: rows per upsert
+        :return: number of rows upserted
+        """
+        import chromadb
+
+        client = chromadb.PersistentClient(path=path)
+        if reset:
+            try:
+                client.delete_collection(name=collection_name)
+            except Exception:
+                pass
+        collection = client.get_or_create_collection(
+            name=collection_name,
+            metadata=metadata or collection_metadata(collection_name, self.meta.get("model"))
+        )
+        if self.meta.get("model") and not model_matches(collection, self.meta["model"]):
+            raise ValueError(f"'{collection_name}' was built with another embedder; rebuild it with --reset")
+
+        print(f"🏗️ Rebuilding '{collection_name}' from {self.rows} staged rows ({self.meta.get('model')})...")
+        written = 0
+        for batch in self.iter_batches(batch_size):
+            collection.upsert(**batch)
+            written += len(batch["ids"])
+        print(f"✅ '{collection_name}' now holds {collection.count()} records")
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "model": self.meta.get("model"),
+            "dim": self.meta.get("dim"),
+            "bytes": sum(os.path.getsize(p) for p in (self.records_path, self.vectors_path) if os.path.exists(p))
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect the staging area or rebuild a collection from it.")
+    parser.add_argument("command", choices=["rebuild", "stats"])
+    parser.add_argument("--staging", default="./pumed_staging", help="staging root (one area per collection)")
+    parser.add_argument("--path", default="./pumed", help="ChromaDB directory")
+    parser.add_argument("--collection", default="pubmed_collection", help="collection to inspect or rebuild")
+    parser.add_argument("--reset", action="store_true", help="drop the collection before rebuilding")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    staging = StagingStore(collection_dir(args.staging, args.collection))
+    if args.command == "stats":
+        print(staging.stats())
+    else:
+        staging.rebuild(args.collection, path=args.path, reset=args.reset, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
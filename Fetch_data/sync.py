@@ -0,0 +1,169 @@
+import json
+import os
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from .pipeline import IngestionPipeline
+from .pubmed import PubMedRetriever as pb
+
+
+class TopicCheckpoint:
+    """
+    Per-topic sync state persisted as JSON:
+    last successful run date, PMIDs already ingested, PMIDs still pending
+    from an interrupted run (with the date that run searched up to) and
+    PMIDs whose batch failed last time.
+    """
+    def __init__(self, topic: str, directory: str = "./pumed/checkpoints") -> None:
+        self.topic = topic
+        slug = re.sub(r"[^a-z0-9]+", "_", topic.lower()).strip("_") or "topic"
+        self.path = os.path.join(directory, f"{slug}.json")
+        self.last_run_date: Optional[str] = None
+        self.ingested: set = set()
+        self.pending: List[str] = []
+        # maxdate of the search that produced ``pending``
+        self.pending_until: Optional[str] = None
+        self.failed: List[str] = []
+        self.load()
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> None:
+        if not self.exists:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.last_run_date = data.get("last_run_date")
+        self.ingested = set(data.get("ingested", []))
+        self.pending = data.get("pending", [])
+        self.pending_until = data.get("pending_until")
+        self.failed = data.get("failed", [])
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {
+            "topic": self.topic,
+            "last_run_date": self.last_run_date,
+            "ingested": sorted(self.ingested),
+            "pending": self.pending,
+            "pending_until": self.pending_until,
+            "failed": self.failed
+        }
+        # Write-then-rename so a crash never leaves a half-written checkpoint
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+class PubMedSync:
+    """
+    Incremental, resumable PubMed sync for one topic.
+    The first run ingests up to ``max_results`` PMIDs; later runs ask
+    esearch for every record created or modified since the last run date.
+    """
+    def __init__(
+        self,
+        search_topic: str,
+        max_results: int = 50,
+        collection_name: str = "pubmed_collection",
+        chunk_size: int = 500,
+        reldate: Optional[int] = None,
+        **pipeline_options
+    ) -> None:
+        """
+        :param search_topic: PubMed query for the topic
+        :param max_results: cap on PMIDs of the first run; deltas are never capped
+        :param collection_name: ChromaDB collection to upsert into
+        :param chunk_size: PMIDs processed between two checkpoint saves
+        :param reldate: restrict the first run to the last N days
+        :param pipeline_options: forwarded to IngestionPipeline
+        """
+        self.search_topic = search_topic
+        self.max_results = max_results
+        self.chunk_size = chunk_size
+        self.reldate = reldate
+        self.checkpoint = TopicCheckpoint(search_topic)
+        self.pipeline = IngestionPipeline(collection_name=collection_name, **pipeline_options)
+
+    def known_ids(self) -> set:
+        """
+        Local set of PMIDs already stored. Seeded once from the collection
+        when there is no checkpoint yet, afterwards kept in the checkpoint.
+        """
+        if not self.checkpoint.exists and not self.checkpoint.ingested:
+            existing = self.pipeline.collection.get(include=[])["ids"]
+            self.checkpoint.ingested = {i[len("pubmed_"):] for i in existing if i.startswith("pubmed_")}
+        return self.checkpoint.ingested
+
+    def find_work(self, today: str) -> List[str]:
+        """
+        Query esearch for the PMIDs that need (re)ingesting.
+        :param today: run date as YYYY/MM/DD
+        :return: PMIDs to fetch, new and changed ones
+        """
+        known = self.known_ids()
+        if self.checkpoint.last_run_date:
+            # Modification date catches both new records and revised ones
+            delta = {"datetype": "mdat", "mindate": self.checkpoint.last_run_date, "maxdate": today}
+            # The checkpoint advances past this delta, so all of it is fetched (large ones by date windows)
+            pmids = pb.search_pubmed_articles(self.search_topic, max_results=None, **delta)
+            changed = [p for p in pmids if p in known]
+            print(f"🔁 {len(pmids)} records changed since {self.checkpoint.last_run_date} "
+                  f"({len(changed)} already stored, will be upserted)")
+            return pmids
+
+        filters = {"reldate": self.reldate, "datetype": "edat"} if self.reldate else {}
+        pmids = pb.search_pubmed_articles(self.search_topic, max_results=self.max_results, **filters)
+        new = [p for p in pmids if p not in known]
+        print(f"🆕 {len(new)} of {len(pmids)} PMIDs are not in the collection yet")
+        return new
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Sync the topic, resuming an interrupted run if the checkpoint has pending PMIDs.
+        :return: summary with the number of PMIDs processed, stored and failed
+        """
+        checkpoint = self.checkpoint
+        today = date.today().strftime("%Y/%m/%d")
+
+        if checkpoint.pending:
+            print(f"⏯️ Resuming '{self.search_topic}': {len(checkpoint.pending)} PMIDs left from the last run")
+        else:
+            work = self.find_work(today)
+            # Retry last run's failures, without queuing anything twice
+            seen = set(work)
+            checkpoint.pending = work + [p for p in checkpoint.failed if p not in seen]
+            checkpoint.pending_until = today
+            checkpoint.failed = []
+            checkpoint.save()
+
+        stored = 0
+        while checkpoint.pending:
+            chunk = checkpoint.pending[:self.chunk_size]
+            self.pipeline.run(chunk)
+            # Near-duplicates count as ingested: they are linked to their representative
+            done = {i[len("pubmed_"):] for i in self.pipeline.stored_ids + self.pipeline.deduplicated_ids}
+            stored += len(done)
+            checkpoint.ingested |= done
+            checkpoint.failed.extend(p for p in chunk if p not in done)
+            checkpoint.pending = checkpoint.pending[len(chunk):]
+            checkpoint.save()
+
+        # The next delta starts where this run's search ended, not at the day a resumed run finished:
+        # records modified in between would otherwise fall outside every later delta
+        if checkpoint.pending_until:
+            checkpoint.last_run_date = checkpoint.pending_until
+        checkpoint.pending_until = None
+        checkpoint.save()
+        summary = {
+            "topic": self.search_topic,
+            "stored": stored,
+            "failed": len(checkpoint.failed),
+            "total_ingested": len(checkpoint.ingested)
+        }
+        print(f"✅ Sync of '{self.search_topic}' done: {summary}")
+        return summary
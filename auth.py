@@ -0,0 +1,330 @@
+"""
+Password hashing, login throttling and signed session tokens.
+
+bcrypt is deliberately slow, so hashes run on a small bounded worker pool
+(bcrypt releases the GIL) instead of the Streamlit script thread, failed
+logins back off per client and per username on that client, and a signed,
+client-bound token lets a reconnecting browser resume its session without
+hashing again.
+
+Usage (measure the cost of each bcrypt work factor on this machine):
+    python auth.py --target-ms 250
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("MEDICHAT_BCRYPT_ROUNDS", "12"))
+SECRET_FILE = os.getenv("MEDICHAT_SECRET_FILE", ".medichat_secret")
+SESSION_TTL = int(os.getenv("MEDICHAT_SESSION_TTL", str(12 * 3600)))
+
+
+class AuthBusy(Exception):
+    """Every hashing worker is busy and the wait queue is full."""
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Too many failed attempts, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def measure_rounds(rounds: int, samples: int = 3) -> float:
+    """
+    :return: median milliseconds for one bcrypt hash at this work factor
+    """
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b"medichat-benchmark", bcrypt.gensalt(rounds))
+        timings.append(1000 * (time.perf_counter() - started))
+    return sorted(timings)[len(timings) // 2]
+
+
+class HashPool:
+    """
+    Bounded pool running bcrypt off the script thread.
+
+    At most ``workers`` hashes run at once and at most ``max_queue`` more
+    wait; anything beyond that fails fast with AuthBusy, so a burst of
+    logins cannot queue unbounded CPU work behind the chat sessions.
+    """
+    def __init__(
+        self,
+        workers: int = int(os.getenv("MEDICHAT_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2)))),
+        max_queue: int = int(os.getenv("MEDICHAT_HASH_QUEUE", "16")),
+        rounds: int = BCRYPT_ROUNDS,
+        timeout: float = 10.0
+    ) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._timings: "deque[float]" = deque(maxlen=256)
+        self._lock = threading.Lock()
+        self.hashes = 0
+        self.rejected = 0
+
+    def _timed(self, fn: Callable[..., Any], *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._timings.append(1000 * (time.perf_counter() - started))
+                self.hashes += 1
+
+    def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise AuthBusy("Password hashing is saturated")
+        try:
+            future = self._executor.submit(self._timed, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash really finishes, even if the caller gave up
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise AuthBusy("Password hashing timed out")
+
+    def hash(self, password: str) -> str:
+        return self._run(
+            lambda: bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("utf-8")
+        )
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._run(lambda: bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8")))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # "$2b$12$..." -> 12; hashes from another cost are upgraded at the next login
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            timings = sorted(self._timings)
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "hashes": self.hashes,
+            "rejected": self.rejected,
+            "p50_ms": round(timings[len(timings) // 2], 1) if timings else None,
+            "p99_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 1) if timings else None
+        }
+
+
+class LoginThrottle:
+    """
+    Exponential backoff on failed logins, keyed e.g. by "client:<address>"
+    and "user:<name>@<address>". Keying usernames per client means nobody
+    can lock another person's account out by failing logins for it.
+
+    The first ``free_attempts`` failures of a key are free; after that each
+    attempt must wait ``base_delay * 2 ** (failures - free_attempts)``
+    seconds (capped at ``max_delay``) since the last failure. Keys without a
+    failure for ``forget_after`` seconds are dropped, and at most
+    ``max_entries`` keys are tracked (least recently failed go first).
+    """
+    def __init__(
+        self,
+        free_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 900.0,
+        forget_after: float = 3600.0,
+        max_entries: int = 10000
+    ) -> None:
+        self.free_attempts = free_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.forget_after = forget_after
+        self.max_entries = max_entries
+        self._failures: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _delay(self, failures: int) -> float:
+        if failures < self.free_attempts:
+            return 0.0
+        return min(self.max_delay, self.base_delay * 2 ** (failures - self.free_attempts))
+
+    def retry_after(self, *keys: str) -> float:
+        """
+        :return: seconds to wait before the next attempt, 0 if allowed now
+        """
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            for key in keys:
+                entry = self._failures.get(key)
+                if entry is None:
+                    continue
+                failures, last = entry
+                if now - last > self.forget_after:
+                    del self._failures[key]
+                    continue
+                wait = max(wait, last + self._delay(failures) - now)
+        return wait
+
+    def check(self, *keys: str) -> None:
+        """
+        :raises Throttled: if any key is still backing off
+        """
+        wait = self.retry_after(*keys)
+        if wait > 0:
+            raise Throttled(wait)
+
+    def failure(self, *keys: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                failures = self._failures.pop(key, (0, now))[0]
+                self._failures[key] = (failures + 1, now)
+            while len(self._failures) > self.max_entries:
+                self._failures.popitem(last=False)
+
+    def success(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._failures.pop(key, None)
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def load_secret(path: str = SECRET_FILE) -> bytes:
+    """
+    Signing key from MEDICHAT_SESSION_SECRET, else from ``path``, which is
+    created with a random key on first use. Rotating it logs everyone out.
+    """
+    secret = os.getenv("MEDICHAT_SESSION_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    key = secrets.token_bytes(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another process won the race; use its key
+        with open(path, "rb") as f:
+            return f.read()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+class SessionSigner:
+    """
+    HMAC-SHA256 session tokens of the form ``<user_id>.<expires>.<signature>``.
+
+    The signature also covers the user's current password hash, so changing
+    the password (or a cost upgrade rehashing it) revokes older tokens, and
+    a client fingerprint (address, user agent), so a token copied to another
+    client is useless. Checking a token is one indexed SELECT and one HMAC,
+    no bcrypt.
+    """
+    def __init__(self, secret: bytes, ttl: int = SESSION_TTL) -> None:
+        self.secret = secret
+        self.ttl = ttl
+
+    def _sign(self, user_id: int, expires: int, password_hash: str, client: str) -> str:
+        message = f"{user_id}.{expires}.{password_hash}.{client}".encode("utf-8")
+        return _b64(hmac.new(self.secret, message, hashlib.sha256).digest())
+
+    def issue(self, user_id: int, password_hash: str, client: str = "") -> str:
+        """
+        :param client: fingerprint of the client the token is handed to
+        """
+        expires = int(time.time()) + self.ttl
+        return f"{user_id}.{expires}.{self._sign(user_id, expires, password_hash, client)}"
+
+    def user_id(self, token: str) -> Optional[int]:
+        """
+        :return: the user id of a well-formed, unexpired token (signature not yet checked)
+        """
+        try:
+            user_id, expires, _ = token.split(".")
+            if int(expires) < time.time():
+                return None
+            return int(user_id)
+        except (AttributeError, ValueError):
+            return None
+
+    def verify(self, token: str, password_hash: str, client: str = "") -> bool:
+        user_id = self.user_id(token)
+        if user_id is None:
+            return False
+        _, expires, signature = token.split(".")
+        return hmac.compare_digest(signature, self._sign(user_id, int(expires), password_hash, client))
+
+
+login_throttle = LoginThrottle()
+# Per address across all usernames; more lenient, since several people may share one address
+client_throttle = LoginThrottle(free_attempts=20)
+
+_hash_pool: Optional[HashPool] = None
+_signer: Optional[SessionSigner] = None
+_lock = threading.Lock()
+
+
+def get_hash_pool() -> HashPool:
+    global _hash_pool
+    with _lock:
+        if _hash_pool is None:
+            _hash_pool = HashPool()
+            print(f"🔐 bcrypt cost {_hash_pool.rounds}: {measure_rounds(_hash_pool.rounds, samples=1):.0f} ms per hash, "
+                  f"{_hash_pool.workers} worker(s)")
+        return _hash_pool
+
+
+def get_signer() -> SessionSigner:
+    global _signer
+    with _lock:
+        if _signer is None:
+            _signer = SessionSigner(load_secret())
+        return _signer
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure bcrypt cost factors on this machine.")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13, 14])
+    parser.add_argument("--target-ms", type=float, default=250.0, help="hash time budget per login")
+    args = parser.parse_args()
+
+    best = None
+    print(f"  {'cost':>4} {'ms':>8}")
+    for rounds in args.rounds:
+        ms = measure_rounds(rounds)
+        print(f"  {rounds:>4} {ms:>8.1f}")
+        if ms <= args.target_ms:
+            best = rounds
+    if best is None:
+        print(f"⚠️ No cost fits {args.target_ms:.0f} ms; use the lowest acceptable one.")
+    else:
+        print(f"🏆 Highest cost within {args.target_ms:.0f} ms: MEDICHAT_BCRYPT_ROUNDS={best} (current {BCRYPT_ROUNDS})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare embedding backends on this machine: encoding throughput and
+retrieval recall@k of each backend against the float (torch) model.
+
+Usage:
+    python benchmark_embedding.py --path ./pumed --collection pubmed_collection --limit 2000
+    python benchmark_embedding.py --texts abstracts.txt --backends torch onnx-int8
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from embedding import BACKENDS, DEFAULT_MODEL
+
+
+def load_texts(args) -> List[str]:
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()][:args.limit]
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=args.path)
+    collection = client.get_collection(name=args.collection)
+    return collection.get(limit=args.limit, include=["documents"])["documents"]
+
+
+def make_queries(texts: List[str], count: int) -> List[str]:
+    # Titles make realistic short questions about documents that are in the corpus
+    step = max(1, len(texts) // count)
+    queries = []
+    for text in texts[::step][:count]:
+        first_line = text.split("\n", 1)[0]
+        queries.append(first_line.replace("Title:", "").strip() or text[:120])
+    return queries
+
+
+def top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    # Vectors are normalized, so the dot product is the cosine similarity
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends.")
+    parser.add_argument("--path", default="./pumed", help="ChromaDB directory")
+    parser.add_argument("--collection", default="pubmed_collection")
+    parser.add_argument("--texts", help="text file with one document per line (instead of a collection)")
+    parser.add_argument("--limit", type=int, default=2000, help="number of documents")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx-int8"], choices=sorted(BACKENDS))
+    args = parser.parse_args()
+
+    texts = load_texts(args)
+    queries = make_queries(texts, args.queries)
+    print(f"📚 {len(texts)} documents, {len(queries)} queries, k={args.k}")
+
+    reference = None
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        # No cache: every run must really encode
+        embedder = BACKENDS[backend](model_name=args.model, cache_dir=None)
+        embedder.encode(texts[:32])  # warm-up
+
+        started = time.perf_counter()
+        doc_vectors = np.asarray(embedder.encode(texts), dtype=np.float32)
+        doc_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        query_vectors = np.asarray([embedder.encode([q])[0] for q in queries], dtype=np.float32)
+        query_ms = 1000 * (time.perf_counter() - started) / len(queries)
+
+        neighbours = top_k(doc_vectors, query_vectors, args.k)
+        if reference is None:
+            reference = neighbours
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(neighbours, reference)])
+
+        print(f"  {backend:<10} {len(texts) / doc_seconds:8.1f} docs/s   "
+              f"{query_ms:6.2f} ms/query   recall@{args.k} vs torch: {recall:.3f}")
+        embedder.close()
+
+
+if __name__ == "__main__":
+    main()
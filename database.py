@@ -0,0 +1,399 @@
+# database.py
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+DB_PATH = os.getenv("MEDICHAT_DB", "medichat.db")
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # readers no longer block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",      # fsync at checkpoints only; safe with WAL
+    "PRAGMA cache_size=-20000",       # ~20 MB page cache per connection
+    "PRAGMA mmap_size=268435456",     # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections shared by all Streamlit sessions.
+
+    Streamlit runs every rerun on a new script thread, so connections are
+    not tied to a thread: they are borrowed for the duration of a ``with``
+    block and handed back. Each connection is opened once in WAL mode with
+    the pragmas above, a busy timeout and a large prepared-statement cache,
+    so helpers that reuse the same SQL text skip re-parsing it.
+    """
+    def __init__(
+        self,
+        path: str = DB_PATH,
+        size: int = int(os.getenv("MEDICHAT_DB_POOL", "8")),
+        busy_timeout: float = 5.0,
+        cached_statements: int = 256
+    ) -> None:
+        self.path = path
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            # Autocommit; writes go through transaction() with BEGIN IMMEDIATE
+            isolation_level=None
+        )
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        # Pool exhausted: wait for a connection to come back
+        try:
+            return self._idle.get(timeout=self.busy_timeout * 2)
+        except queue.Empty:
+            # Same error type as a busy database, so callers' sqlite3 handlers cover it
+            raise sqlite3.OperationalError("database pool exhausted") from None
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for reads (autocommit)."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection inside a write transaction. BEGIN IMMEDIATE takes
+        the write lock up front, so a busy database waits out the busy
+        timeout instead of failing on a lock upgrade halfway through.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def connection():
+    return get_pool().connection()
+
+
+def transaction():
+    return get_pool().transaction()
+
+
+class ReadCache:
+    """
+    Process-wide read-through cache for small per-user, per-tab queries.
+
+    Every (user_id, tab_name) pair has a version counter that writers bump
+    after committing. A cached value is served only while it was read at the
+    current version, so unchanged sidebars skip SQLite entirely and any
+    session sees another session's writes on its next rerun.
+
+    Queued writes are announced with begin_write and finished with end_write
+    (both bump the version); while any is pending nothing is cached for the
+    tab, and readers can check ``pending`` to flush the writer first.
+    """
+    def __init__(self, max_entries: int = 2048) -> None:
+        self.max_entries = max_entries
+        self._versions: Dict[Tuple[Any, str], int] = {}
+        self._pending: Dict[Tuple[Any, str], int] = {}
+        self._entries: "OrderedDict[Tuple[str, Any, str], Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, user_id: Any, tab_name: str) -> None:
+        with self._lock:
+            self._versions[(user_id, tab_name)] = self._versions.get((user_id, tab_name), 0) + 1
+
+    def begin_write(self, user_id: Any, tab_name: str) -> None:
+        """A write for the tab was queued: cached values are stale from now on."""
+        with self._lock:
+            key = (user_id, tab_name)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._pending[key] = self._pending.get(key, 0) + 1
+
+    def end_write(self, user_id: Any, tab_name: str) -> None:
+        """A write announced by begin_write was committed or dropped."""
+        with self._lock:
+            key = (user_id, tab_name)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            if self._pending.get(key, 0) > 1:
+                self._pending[key] -= 1
+            else:
+                self._pending.pop(key, None)
+
+    def pending(self, user_id: Any, tab_name: str) -> bool:
+        with self._lock:
+            return (user_id, tab_name) in self._pending
+
+    def get(self, kind: str, user_id: Any, tab_name: str, loader: Callable[[], Any]) -> Any:
+        """
+        :param kind: query name, e.g. "history" or "files"
+        :param loader: runs the query on a miss; exceptions propagate and nothing is cached
+        """
+        key = (kind, user_id, tab_name)
+        with self._lock:
+            version = self._versions.get((user_id, tab_name), 0)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            # A write that landed (or was queued) while loading makes this value stale: don't keep it
+            if self._versions.get((user_id, tab_name), 0) == version and (user_id, tab_name) not in self._pending:
+                self._entries[key] = (version, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+read_cache = ReadCache()
+
+
+def _chain(first: Optional[Callable[..., None]], second: Optional[Callable[..., None]]) -> Optional[Callable[..., None]]:
+    # Both callbacks of a coalesced write, in submission order
+    if first is None or second is None:
+        return first or second
+
+    def both(*args: Any) -> None:
+        first(*args)
+        second(*args)
+    return both
+
+
+class WriteBehindQueue:
+    """
+    Background writer so the UI never waits on disk.
+
+    Writes are callables taking a connection. They are queued (bounded:
+    submitters block when ``max_pending`` writes are waiting) and a single
+    writer thread commits everything pending in one transaction. A write
+    submitted with a ``key`` replaces a pending write with the same key,
+    so repeated saves of one tab collapse into the latest one; a
+    ``barrier`` write (e.g. a rename) is never reordered with anything.
+
+    ``mode="sync"`` (MEDICHAT_DURABILITY=sync) commits each write before
+    ``submit`` returns, for deployments that prefer durability to latency.
+    A write that cannot be committed is dropped and reported to its
+    ``on_error`` callback, since the submitter has usually moved on.
+    """
+    def __init__(self, mode: str = "async", max_pending: int = 256, batch_window: float = 0.05) -> None:
+        if mode not in ("async", "sync"):
+            raise ValueError(f"Unknown durability mode: {mode}")
+        self.mode = mode
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self._ops: List[Tuple[Callable[[sqlite3.Connection], None], Optional[Callable[[], None]],
+                              Optional[Callable[[Exception], None]]]] = []
+        self._index: Dict[Any, int] = {}
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self.batches = 0
+        self.writes = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._thread = None
+        if mode == "async":
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def submit(
+        self,
+        write: Callable[[sqlite3.Connection], None],
+        key: Any = None,
+        barrier: bool = False,
+        after: Optional[Callable[[], None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None
+    ) -> None:
+        """
+        :param write: runs inside the writer's transaction
+        :param key: coalescing key; a pending write with the same key is replaced
+            (its callbacks still run, together with the replacement's)
+        :param barrier: later writes never coalesce into writes queued before this one
+        :param after: called once the write is committed (e.g. cache invalidation)
+        :param on_error: called with the exception if the write is dropped (on the writer thread)
+        """
+        if self.mode == "sync":
+            self._apply([(write, after, on_error)])
+            return
+        with self._cond:
+            if key is not None and key in self._index:
+                _, replaced_after, replaced_on_error = self._ops[self._index[key]]
+                self._ops[self._index[key]] = (write, _chain(replaced_after, after), _chain(replaced_on_error, on_error))
+                self.coalesced += 1
+                return
+            while len(self._ops) >= self.max_pending:
+                self._cond.wait()
+            if barrier:
+                self._index = {}
+            self._ops.append((write, after, on_error))
+            if key is not None and not barrier:
+                self._index[key] = len(self._ops) - 1
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ops and not self._closed:
+                    self._cond.wait()
+                if not self._ops:
+                    return
+            # Give a burst of saves (e.g. user + assistant turn) time to coalesce
+            time.sleep(self.batch_window)
+            with self._cond:
+                batch, self._ops, self._index = self._ops, [], {}
+                self._busy = True
+                self._cond.notify_all()
+            try:
+                self._apply(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _apply(self, batch: list) -> None:
+        committed = []
+        try:
+            with transaction() as conn:
+                for write, _, _ in batch:
+                    write(conn)
+            committed = [after for _, after, _ in batch]
+        except Exception as e:
+            # One bad write must not sink the batch: retry each on its own
+            print(f"⚠️ Batched write of {len(batch)} failed ({e}), retrying one by one")
+            for write, after, on_error in batch:
+                try:
+                    with transaction() as conn:
+                        write(conn)
+                    committed.append(after)
+                except Exception as e:
+                    self.failed += 1
+                    print(f"❌ Write dropped: {e}")
+                    if on_error is not None:
+                        on_error(e)
+        self.batches += 1
+        self.writes += len(committed)
+        for after in committed:
+            if after is not None:
+                after()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every submitted write is committed.
+        :return: False if the timeout expired first
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._ops or self._busy:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._ops)
+        return {
+            "mode": self.mode,
+            "pending": pending,
+            "batches": self.batches,
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "failed": self.failed
+        }
+
+
+_writer: Optional[WriteBehindQueue] = None
+
+
+def get_writer() -> WriteBehindQueue:
+    global _writer
+    with _pool_lock:
+        if _writer is None:
+            _writer = WriteBehindQueue(mode=os.getenv("MEDICHAT_DURABILITY", "async"))
+        return _writer
@@ -0,0 +1,368 @@
+# embedding.py
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Same weights as Chroma's default embedding function, so vectors computed
+# here are interchangeable with the ones Chroma computes for query_texts.
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+@contextmanager
+def _locked(path: str, exclusive: bool = True) -> Iterator[None]:
+    # Advisory lock shared by every process using the same cache directory
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of (model, sha256(text)) -> vector.
+
+    Each model gets its own subdirectory of ``directory``. Vectors live in
+    one append-only float32 file read through a memory map; ``keys.bin``
+    holds the 32-byte text digests in the same row order and ``meta.json``
+    records the model and dimension.
+
+    Several processes (the app and an ingestion run) may share a cache:
+    appends take an exclusive file lock and number new rows by what is on
+    disk, and rows appended by other processes are picked up on a miss.
+    """
+    def __init__(self, directory: str, model_name: str) -> None:
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+        self.model_name = model_name
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.keys_path = os.path.join(self.directory, "keys.bin")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.lock_path = os.path.join(self.directory, "lock")
+        self.hits = 0
+        self.misses = 0
+        self.dim: Optional[int] = None
+        self.rows: Dict[bytes, int] = {}
+        self.count = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _read_meta(self) -> Dict[str, Any]:
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with _locked(self.lock_path):
+            meta = self._read_meta()
+            if meta and meta.get("model") != self.model_name:
+                # Only ever happens if two model ids map to the same directory name
+                print(f"♻️ Embedding model changed ({meta.get('model')} -> {self.model_name}), clearing cache")
+                for path in (self.vectors_path, self.keys_path, self.meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._refresh()
+
+    def _disk_rows(self) -> int:
+        if not self.dim or not os.path.exists(self.keys_path) or not os.path.exists(self.vectors_path):
+            return 0
+        # A crash between the two appends can leave one file longer than the other
+        return min(os.path.getsize(self.keys_path) // 32, os.path.getsize(self.vectors_path) // (4 * self.dim))
+
+    def _refresh(self) -> None:
+        # Index rows appended (by any process) since the last refresh; call with the file lock held
+        if self.dim is None:
+            self.dim = self._read_meta().get("dim")
+        count = self._disk_rows()
+        if count <= self.count:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self.count * 32)
+            keys = f.read((count - self.count) * 32)
+        for i in range(count - self.count):
+            self.rows.setdefault(keys[i * 32:(i + 1) * 32], self.count + i)
+        self.count = count
+
+    def _map(self):
+        # Re-map lazily whenever rows were appended since the last mapping
+        if self._matrix is None or len(self._matrix) < self.count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        return self._matrix
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, digests: List[bytes]) -> List[Optional[List[float]]]:
+        with self._lock:
+            if any(d not in self.rows for d in digests):
+                with _locked(self.lock_path, exclusive=False):
+                    self._refresh()
+            found = [self.rows.get(d) for d in digests]
+            matrix = self._map() if self.rows else None
+            result = [matrix[row].tolist() if row is not None else None for row in found]
+            hits = sum(row is not None for row in found)
+            self.hits += hits
+            self.misses += len(found) - hits
+        return result
+
+    def put_many(self, digests: List[bytes], vectors: List[List[float]]) -> None:
+        with self._lock, _locked(self.lock_path):
+            # Another process may have appended since we last looked: row numbers come from the files
+            self._refresh()
+            new = {}
+            for d, v in zip(digests, vectors):
+                if d not in self.rows:
+                    new.setdefault(d, v)
+            new = list(new.items())
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = len(new[0][1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim}, f)
+            # Drop a torn tail left by a crash so both files end at row self.count
+            for path, row_bytes in ((self.vectors_path, 4 * self.dim), (self.keys_path, 32)):
+                if os.path.exists(path) and os.path.getsize(path) > self.count * row_bytes:
+                    os.truncate(path, self.count * row_bytes)
+            block = np.asarray([v for _, v in new], dtype=np.float32)
+            # Vectors first, then keys: a key never points past the vector file
+            with open(self.vectors_path, "ab") as f:
+                f.write(block.tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(d for d, _ in new))
+            for d, _ in new:
+                self.rows[d] = self.count
+                self.count += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class Embedder:
+    """
+    Batched sentence-transformers encoder.
+
+    Texts are sorted by length and cut into batches so each batch pads to a
+    similar length; batches are encoded on a thread pool (torch releases the
+    GIL) or, with ``processes > 1``, on a sentence-transformers process pool.
+    Instances are callable, so they also work as a Chroma embedding function.
+    """
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        batch_size: int = 64,
+        workers: Optional[int] = None,
+        processes: int = 0,
+        device: str = "cpu",
+        cache_dir: Optional[str] = None
+    ) -> None:
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.model = self.load_model(device)
+        self.cache = EmbeddingCache(cache_dir, self.model_id) if cache_dir else None
+        self.pool = self.model.start_multi_process_pool([device] * processes) if processes > 1 else None
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+        self._lock = threading.Lock()
+        self.docs = 0
+        self.seconds = 0.0
+
+    @property
+    def model_id(self) -> str:
+        # Identifies the vectors this embedder produces (used to key the cache)
+        return self.model_name
+
+    def load_model(self, device: str):
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.model_name, device=device)
+
+    def _encode_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def encode(self, texts: List[str], cache: bool = True) -> List[List[float]]:
+        """
+        Embed texts, returning vectors in the input order.
+        Texts already in the embedding cache are not re-encoded.
+        :param texts: list of documents
+        :param cache: False bypasses the embedding cache entirely (e.g. one-off
+            search queries, which would only make it grow)
+        :return: list of normalized embedding vectors
+        """
+        if not texts:
+            return []
+        if self.cache is None or not cache:
+            return self._encode(texts)
+
+        digests = [EmbeddingCache.digest(t) for t in texts]
+        result = self.cache.get_many(digests)
+        missing = [i for i, v in enumerate(result) if v is None]
+        if missing:
+            vectors = self._encode([texts[i] for i in missing])
+            self.cache.put_many([digests[i] for i in missing], vectors)
+            for i, vector in zip(missing, vectors):
+                result[i] = vector
+        return result
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+
+        # Length-sorted batching keeps padding (and wasted FLOPs) to a minimum
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        ordered = [texts[i] for i in order]
+        if self.pool is not None:
+            vectors = self.model.encode(ordered, pool=self.pool, batch_size=self.batch_size,
+                                        normalize_embeddings=True).tolist()
+        else:
+            batches = [ordered[i:i + self.batch_size] for i in range(0, len(ordered), self.batch_size)]
+            vectors = [v for batch in self._executor.map(self._encode_batch, batches) for v in batch]
+
+        result: List[Any] = [None] * len(texts)
+        for position, index in enumerate(order):
+            result[index] = vectors[position]
+
+        with self._lock:
+            self.docs += len(texts)
+            self.seconds += time.perf_counter() - started
+        return result
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.encode(list(input))
+
+    def stats(self) -> Dict[str, Any]:
+        # docs/seconds only count texts that were actually encoded (cache misses)
+        return {
+            "model": self.model_id,
+            "docs": self.docs,
+            "seconds": round(self.seconds, 3),
+            "docs_per_second": round(self.docs / self.seconds, 1) if self.seconds else 0.0,
+            "cache": self.cache.stats() if self.cache else None
+        }
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+        self._executor.shutdown(wait=False)
+
+
+class OnnxEmbedder(Embedder):
+    """
+    CPU backend: the same model exported to ONNX with dynamic int8
+    quantization, run by onnxruntime with a fixed intra-op thread count.
+    The export happens once and is kept under ``export_dir``.
+    Needs the optional ``sentence-transformers[onnx]`` extra.
+    """
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        quantization: str = "avx2",
+        threads: Optional[int] = None,
+        export_dir: str = "./onnx_models",
+        **kwargs
+    ) -> None:
+        """
+        :param quantization: sentence-transformers quantization preset: "arm64", "avx2", "avx512" or "avx512_vnni"
+        :param threads: onnxruntime intra-op threads (default: all cores)
+        :param export_dir: where the exported and quantized model is stored
+        """
+        self.quantization = quantization
+        self.threads = threads or os.cpu_count() or 1
+        self.export_path = os.path.join(export_dir, model_name.replace("/", "__"))
+        # onnxruntime parallelises inside each call, so one batch at a time is enough
+        kwargs.setdefault("workers", 1)
+        super().__init__(model_name=model_name, **kwargs)
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.model_name}#onnx-qint8-{self.quantization}"
+
+    def load_model(self, device: str):
+        import onnxruntime
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        file_name = f"onnx/model_qint8_{self.quantization}.onnx"
+        if not os.path.exists(os.path.join(self.export_path, file_name)):
+            print(f"📦 Exporting {self.model_name} to ONNX with int8 quantization ({self.quantization})...")
+            float_model = SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+            float_model.save_pretrained(self.export_path)
+            export_dynamic_quantized_onnx_model(float_model, self.quantization, self.export_path)
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = self.threads
+        session_options.inter_op_num_threads = 1
+        return SentenceTransformer(
+            self.export_path,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={
+                "file_name": file_name,
+                "provider": "CPUExecutionProvider",
+                "session_options": session_options
+            }
+        )
+
+
+BACKENDS = {
+    "torch": Embedder,
+    "onnx-int8": OnnxEmbedder
+}
+
+
+@lru_cache(maxsize=None)
+def get_embedder(model_name: str = DEFAULT_MODEL, backend: Optional[str] = None) -> Embedder:
+    """
+    Shared Embedder per model and backend, so ingestion and retrieval load the weights once.
+    The backend ("torch" or "onnx-int8") defaults to EMBED_BACKEND.
+    Worker/process counts come from EMBED_WORKERS / EMBED_PROCESSES / EMBED_BATCH_SIZE,
+    ONNX threads from EMBED_THREADS, the cache location from EMBED_CACHE_DIR
+    (empty string disables the cache).
+    """
+    backend = backend or os.getenv("EMBED_BACKEND", "torch")
+    cache_dir = os.getenv("EMBED_CACHE_DIR", "./embedding_cache")
+    options = {
+        "model_name": model_name,
+        "batch_size": int(os.getenv("EMBED_BATCH_SIZE", "64")),
+        "cache_dir": os.path.join(cache_dir, backend) if cache_dir else None
+    }
+    if backend == "onnx-int8":
+        options["threads"] = int(os.getenv("EMBED_THREADS", "0")) or None
+        options["quantization"] = os.getenv("EMBED_QUANTIZATION", "avx2")
+    else:
+        options["workers"] = int(os.getenv("EMBED_WORKERS", "0")) or None
+        options["processes"] = int(os.getenv("EMBED_PROCESSES", "0"))
+    return BACKENDS[backend](**options)
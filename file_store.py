@@ -0,0 +1,97 @@
+# file_store.py
+import gzip
+import hashlib
+import os
+import uuid
+from typing import BinaryIO, Optional, Tuple
+
+FILES_DIR = os.getenv("MEDICHAT_FILES_DIR", "./medichat_files")
+CHUNK_SIZE = 1 << 20
+
+# Formats that are already compressed; gzip would only cost CPU
+_COMPRESSED_TYPES = ("image/", "video/", "audio/", "application/pdf", "application/zip",
+                     "application/gzip", "application/x-7z-compressed",
+                     "application/vnd.openxmlformats-officedocument")
+
+
+class _HashingSink:
+    # Counts and hashes the raw bytes on their way to the (possibly gzip) file
+    def __init__(self, target: BinaryIO) -> None:
+        self.target = target
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.sha256.update(data)
+        self.size += len(data)
+        self.target.write(data)
+
+
+class FileStore:
+    """
+    Content-addressed store for chat attachments.
+
+    Layout under ``directory``:
+        objects/ab/<sha256>      raw file, named by the sha256 of its content
+        objects/ab/<sha256>.gz   same, gzip-compressed
+        tmp/                     uploads in progress
+
+    Uploads are copied in chunks while hashing, so memory stays flat, and a
+    file already present is stored once no matter how often it is attached.
+    The database keeps only the hash and size.
+    """
+    def __init__(self, directory: str = FILES_DIR, compress: bool = os.getenv("MEDICHAT_FILES_COMPRESS", "1") == "1") -> None:
+        self.directory = directory
+        self.compress = compress
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "tmp"), exist_ok=True)
+
+    def _object_path(self, digest: str, compressed: bool) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest + (".gz" if compressed else ""))
+
+    def find(self, digest: str) -> Optional[str]:
+        for compressed in (True, False):
+            path = self._object_path(digest, compressed)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put(self, source: BinaryIO, content_type: str = "") -> Tuple[str, int]:
+        """
+        Stream a file-like object into the store.
+        :param source: readable binary file-like object
+        :param content_type: MIME type, used to skip compressing compressed formats
+        :return: (sha256 hex digest, size in bytes)
+        """
+        compressed = self.compress and not (content_type or "").startswith(_COMPRESSED_TYPES)
+        tmp_path = os.path.join(self.directory, "tmp", uuid.uuid4().hex)
+        try:
+            with open(tmp_path, "wb") as raw:
+                target = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) if compressed else raw
+                sink = _HashingSink(target)
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    sink.write(chunk)
+                if compressed:
+                    target.close()
+            digest = sink.sha256.hexdigest()
+            if self.find(digest):
+                os.remove(tmp_path)  # already stored
+            else:
+                path = self._object_path(digest, compressed)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return digest, sink.size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, digest: str) -> BinaryIO:
+        """
+        :return: readable stream of the original bytes
+        :raises FileNotFoundError: if the object is not in the store
+        """
+        path = self.find(digest)
+        if path is None:
+            raise FileNotFoundError(digest)
+        return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
@@ -0,0 +1,53 @@
+# hnsw_config.py
+import json
+import os
+from typing import Any, Dict, Optional
+
+# Written by tune_hnsw.py; one entry per collection name
+PARAMS_FILE = os.getenv("HNSW_PARAMS_FILE", "hnsw_params.json")
+# Collection metadata key naming the embedder (Embedder.model_id) its vectors come from
+MODEL_KEY = "embed:model"
+
+
+def load_params() -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(PARAMS_FILE):
+        return {}
+    with open(PARAMS_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def collection_metadata(collection_name: str, model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Metadata to create a collection with: cosine space, the embedder the
+    vectors come from plus the tuned HNSW parameters for that collection,
+    if any. Chroma only applies HNSW settings when a collection is created,
+    so existing collections need a rebuild (e.g. python -m Fetch_data.staging
+    rebuild --reset) to pick them up.
+    """
+    metadata = {"hnsw:space": "cosine"}
+    if model_id:
+        metadata[MODEL_KEY] = model_id
+    tuned = load_params().get(collection_name, {})
+    for key in ("M", "construction_ef", "search_ef"):
+        if key in tuned:
+            metadata[f"hnsw:{key}"] = int(tuned[key])
+    return metadata
+
+
+def model_matches(collection, model_id: str) -> bool:
+    """
+    Whether ``model_id`` vectors can be searched against or added to the collection.
+    Collections created before the model was recorded are assumed to match.
+    """
+    stored = (collection.metadata or {}).get(MODEL_KEY)
+    if stored is None or stored == model_id:
+        return True
+    print(f"⚠️ Collection '{collection.name}' holds {stored} vectors, not {model_id}")
+    return False
+
+
+def save_params(collection_name: str, params: Dict[str, Any]) -> None:
+    all_params = load_params()
+    all_params[collection_name] = params
+    with open(PARAMS_FILE, "w", encoding="utf-8") as f:
+        json.dump(all_params, f, indent=2)
@@ -1,11 +1,17 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import json
 import uuid
 import datetime
+import io
 import sqlite3
 import hashlib
 import os
-import bcrypt
+import threading
+import time
+import auth
+import database as db
+from file_store import FileStore
 from datetime import datetime as dt
 from pathlib import Path
 
@@ -107,217 +113,609 @@ st.set_page_config(
 )
 
 # Database setup
+file_store = FileStore()
+
+# Bump together with a new migration block in init_db
+SCHEMA_VERSION = 4
+
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect('medichat.db')
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # User chats table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_chats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            tab_name TEXT NOT NULL,
-            chat_data TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(user_id, tab_name)
-        )
-    ''')
-    
-    # User files table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            tab_name TEXT NOT NULL,
-            file_name TEXT NOT NULL,
-            file_content BLOB NOT NULL,
-            file_type TEXT NOT NULL,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Chat history table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            tab_name TEXT NOT NULL,
-            history_data TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    # Once per process, not per rerun; and an up-to-date schema is one read, no write lock
+    with db.connection() as conn:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+    with db.transaction() as conn:
+        c = conn.cursor()
+        
+        # Users table
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # User chats table
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_chats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                tab_name TEXT NOT NULL,
+                chat_data TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                UNIQUE(user_id, tab_name)
+            )
+        ''')
+        
+        # User files table: references into the file store, no content
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                tab_name TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        
+        # Chat history table
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                tab_name TEXT NOT NULL,
+                history_data TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                parent_id INTEGER,
+                end_seq INTEGER,
+                user_message TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        
+        # Messages table: one row per turn, appended instead of rewriting the tab
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                tab_name TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT,
+                attachments TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                UNIQUE(user_id, tab_name, seq)
+            )
+        ''')
+        
+        # Schema version 1: move the whole-tab JSON blobs of user_chats into messages
+        if c.execute('PRAGMA user_version').fetchone()[0] < 1:
+            for user_id, tab_name, chat_data in c.execute('SELECT user_id, tab_name, chat_data FROM user_chats').fetchall():
+                try:
+                    chat_messages = json.loads(chat_data) if chat_data else []
+                except ValueError:
+                    chat_messages = []
+                c.executemany(INSERT_MESSAGE, [message_row(user_id, tab_name, seq, message)
+                                               for seq, message in enumerate(chat_messages)])
+            # user_chats keeps one row per tab (the tab list), without the blob
+            c.execute("UPDATE user_chats SET chat_data = '[]'")
+            c.execute('PRAGMA user_version = 1')
+        
+        # Schema version 2: history snapshots become deltas chained by parent_id.
+        # Existing rows hold full copies, i.e. they already are chain roots.
+        if c.execute('PRAGMA user_version').fetchone()[0] < 2:
+            columns = {row[1] for row in c.execute('PRAGMA table_info(chat_history)')}
+            for column, column_type in (("parent_id", "INTEGER"), ("end_seq", "INTEGER"), ("user_message", "TEXT")):
+                if column not in columns:
+                    c.execute(f'ALTER TABLE chat_history ADD COLUMN {column} {column_type}')
+            for history_id, history_json in c.execute('SELECT id, history_data FROM chat_history WHERE end_seq IS NULL').fetchall():
+                try:
+                    history_data = json.loads(history_json)
+                except ValueError:
+                    history_data = {}
+                c.execute('UPDATE chat_history SET end_seq = ?, user_message = ? WHERE id = ?',
+                          (len(history_data.get("messages", [])), history_data.get("user_message", ""), history_id))
+            c.execute('PRAGMA user_version = 2')
+        
+        # Schema version 3: move user_files BLOBs into the content-addressed file store
+        if c.execute('PRAGMA user_version').fetchone()[0] < 3:
+            columns = {row[1] for row in c.execute('PRAGMA table_info(user_files)')}
+            if "file_content" in columns:
+                c.execute('''
+                    CREATE TABLE user_files_new (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        tab_name TEXT NOT NULL,
+                        file_name TEXT NOT NULL,
+                        file_type TEXT NOT NULL,
+                        sha256 TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users (id)
+                    )
+                ''')
+                # One row at a time, so the migration never holds every BLOB in memory
+                for (file_id,) in c.execute('SELECT id FROM user_files ORDER BY id').fetchall():
+                    user_id, tab_name, file_name, file_content, file_type, uploaded_at = c.execute(
+                        '''SELECT user_id, tab_name, file_name, file_content, file_type, uploaded_at
+                           FROM user_files WHERE id = ?''', (file_id,)).fetchone()
+                    sha256, size = file_store.put(io.BytesIO(file_content), file_type)
+                    c.execute('''INSERT INTO user_files_new (id, user_id, tab_name, file_name, file_type, sha256, size, uploaded_at)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                              (file_id, user_id, tab_name, file_name, file_type, sha256, size, uploaded_at))
+                c.execute('DROP TABLE user_files')
+                c.execute('ALTER TABLE user_files_new RENAME TO user_files')
+            c.execute('PRAGMA user_version = 3')
+        
+        c.execute('CREATE INDEX IF NOT EXISTS idx_user_files_tab ON user_files (user_id, tab_name)')
+        
+        # Covering index for the history sidebar: no table lookups, no sort
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_chat_history_tab
+                     ON chat_history (user_id, tab_name, created_at, id, user_message)''')
+        
+        # Schema version 4: full-text index over message content, kept in sync by triggers.
+        # user_id is indexed too, so a search only ranks the searching user's matches.
+        if c.execute('PRAGMA user_version').fetchone()[0] < 4:
+            try:
+                c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                                content, user_id, content='messages', content_rowid='id',
+                                tokenize='porter unicode61 remove_diacritics 2')''')
+                c.execute('''CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                                INSERT INTO messages_fts (rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+                             END''')
+                c.execute('''CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                                INSERT INTO messages_fts (messages_fts, rowid, content, user_id)
+                                VALUES ('delete', old.id, old.content, old.user_id);
+                             END''')
+                c.execute('''CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+                                INSERT INTO messages_fts (messages_fts, rowid, content, user_id)
+                                VALUES ('delete', old.id, old.content, old.user_id);
+                                INSERT INTO messages_fts (rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+                             END''')
+                # Index the messages stored before this version
+                c.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+                c.execute('PRAGMA user_version = 4')
+            except sqlite3.OperationalError as e:
+                # SQLite built without FTS5: everything but search keeps working
+                print(f"ℹ️ Full-text search disabled: {e}")
+
+INSERT_MESSAGE = '''INSERT INTO messages (user_id, tab_name, seq, role, content, timestamp, attachments)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+def message_row(user_id, tab_name, seq, message):
+    attachments = message.get("attachments")
+    return (user_id, tab_name, seq, message.get("role", "user"), str(message.get("content", "")),
+            message.get("timestamp") or dt.now().isoformat(),
+            json.dumps(attachments) if attachments else None)
+
+def row_to_message(role, content, timestamp, attachments):
+    message = {"role": role, "content": content, "timestamp": timestamp}
+    if attachments:
+        message["attachments"] = json.loads(attachments)
+    return message
 
 init_db()
 
 # Authentication functions
+# bcrypt runs on auth's bounded worker pool (cost: MEDICHAT_BCRYPT_ROUNDS);
+# failed logins back off per username and per client address.
+hash_pool = auth.get_hash_pool()
+
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return hash_pool.hash(password)
 
 def check_password(password, hashed):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return hash_pool.verify(password, hashed)
+
+def client_address():
+    # Behind a reverse proxy the socket peer is the proxy itself
+    if os.getenv("MEDICHAT_TRUST_PROXY") == "1":
+        forwarded = st.context.headers.get("X-Forwarded-For", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return st.context.ip_address or "unknown"
+
+def client_fingerprint():
+    # Session tokens only verify for the address and browser they were issued to
+    return f"{client_address()}|{st.context.headers.get('User-Agent', '')}"
 
 def register_user(username, email, password):
+    """
+    :raises auth.AuthBusy: if password hashing is saturated
+    """
     try:
-        conn = sqlite3.connect('medichat.db')
-        c = conn.cursor()
         password_hash = hash_password(password)
-        c.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
-                 (username, email, password_hash))
-        conn.commit()
+        with db.transaction() as conn:
+            conn.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                         (username, email, password_hash))
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
-def login_user(username, password):
-    try:
-        conn = sqlite3.connect('medichat.db')
-        c = conn.cursor()
-        c.execute('SELECT id, username, password_hash FROM users WHERE username = ?', (username,))
-        user = c.fetchone()
-        if user and check_password(password, user[2]):
-            return user[0], user[1]  # user_id, username
+def login_user(username, password, client=None):
+    """
+    :return: (user_id, username, session token), or None on bad credentials
+    :raises auth.Throttled: if this client is backing off (for this username or overall)
+    :raises auth.AuthBusy: if password hashing is saturated
+    """
+    client = client or client_address()
+    # Usernames are throttled per client: failures elsewhere never lock the account out here
+    user_key, client_key = f"user:{username.lower()}@{client}", f"client:{client}"
+    auth.login_throttle.check(user_key)
+    auth.client_throttle.check(client_key)
+    with db.connection() as conn:
+        user = conn.execute('SELECT id, username, password_hash FROM users WHERE username = ?', (username,)).fetchone()
+    if not (user and check_password(password, user[2])):
+        auth.login_throttle.failure(user_key)
+        auth.client_throttle.failure(client_key)
+        return None
+    auth.login_throttle.success(user_key)
+    password_hash = user[2]
+    if hash_pool.needs_rehash(password_hash):
+        # Stored with another cost: upgrade it while the plaintext is at hand
+        try:
+            password_hash = hash_password(password)
+            with db.transaction() as conn:
+                conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user[0]))
+        except Exception as e:
+            password_hash = user[2]
+            print(f"⚠️ Could not rehash password for user {user[0]}: {e}")
+    token = auth.get_signer().issue(user[0], password_hash, client_fingerprint())
+    return user[0], user[1], token  # user_id, username, session token
+
+def resume_session(token, client):
+    """
+    Restore a login from a signed session token, without bcrypt.
+    :param client: fingerprint of the requesting client, see client_fingerprint
+    :return: (user_id, username), or None if the token is invalid, expired, revoked or from another client
+    """
+    signer = auth.get_signer()
+    user_id = signer.user_id(token)
+    if user_id is None:
         return None
-    finally:
-        conn.close()
+    with db.connection() as conn:
+        user = conn.execute('SELECT id, username, password_hash FROM users WHERE id = ?', (user_id,)).fetchone()
+    if user and signer.verify(token, user[2], client):
+        return user[0], user[1]
+    return None
+
+# Session token cookie; kept out of the URL (history, Referer headers, shared links, logs)
+SESSION_COOKIE = "medichat_session"
+
+def write_session_cookie(token, max_age):
+    # Streamlit can read cookies (st.context.cookies) but not set them: a
+    # zero-height same-origin component sets it on the app's page instead
+    components.html(f'''<script>
+const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+window.parent.document.cookie = "{SESSION_COOKIE}={token}; Path=/; Max-Age={int(max_age)}; SameSite=Strict" + secure;
+</script>''', height=0)
 
 # Save/load user data functions
-def save_user_chat(user_id, tab_name, chat_data):
+# Writes go through the write-behind queue (database.WriteBehindQueue): the UI
+# repaints right away and a background thread commits them in batches.
+writer = db.get_writer()
+
+def _report_to(errors, message):
+    # on_error callback for the writer thread: it only appends to the session's
+    # plain list (never st.session_state itself); main_app shows it on the next rerun
+    if errors is None:
+        return None
+    return lambda e: errors.append(f"{message}: {e}")
+
+def _submit_tab_write(user_id, tab_name, write, errors, message, key=None):
+    """
+    Queue a write for one tab. Its cached reads are invalidated at once and
+    bypassed (see _read_tab) until the write is committed or dropped.
+    """
+    db.read_cache.begin_write(user_id, tab_name)
+    report = _report_to(errors, message)
+    def dropped(e):
+        db.read_cache.end_write(user_id, tab_name)
+        if report:
+            report(e)
     try:
-        conn = sqlite3.connect('medichat.db')
-        c = conn.cursor()
-        chat_json = json.dumps(chat_data, default=str)
-        
-        c.execute('SELECT id FROM user_chats WHERE user_id = ? AND tab_name = ?', (user_id, tab_name))
-        existing = c.fetchone()
-        
-        if existing:
-            c.execute('''UPDATE user_chats 
-                        SET chat_data = ?, updated_at = CURRENT_TIMESTAMP 
-                        WHERE id = ?''', 
-                     (chat_json, existing[0]))
-        else:
-            c.execute('''INSERT INTO user_chats (user_id, tab_name, chat_data) 
-                        VALUES (?, ?, ?)''', 
-                     (user_id, tab_name, chat_json))
-        
-        conn.commit()
+        writer.submit(write, key=key, after=lambda: db.read_cache.end_write(user_id, tab_name), on_error=dropped)
+    except:
+        db.read_cache.end_write(user_id, tab_name)
+        raise
+
+def _read_tab(kind, user_id, tab_name, query):
+    # The tab has queued writes: read them back rather than the last commit
+    if db.read_cache.pending(user_id, tab_name):
+        writer.flush()
+    return db.read_cache.get(kind, user_id, tab_name, query)
+
+def _write_user_chat(conn, user_id, tab_name, chat_data):
+    # Register the tab; relies on UNIQUE(user_id, tab_name)
+    conn.execute('''INSERT INTO user_chats (user_id, tab_name, chat_data) 
+                    VALUES (?, ?, '[]')
+                    ON CONFLICT(user_id, tab_name) DO UPDATE
+                    SET updated_at = CURRENT_TIMESTAMP''', 
+                 (user_id, tab_name))
+    last = conn.execute('''SELECT seq, role, content FROM messages
+                           WHERE user_id = ? AND tab_name = ?
+                           ORDER BY seq DESC LIMIT 1''',
+                        (user_id, tab_name)).fetchone()
+    stored = last[0] + 1 if last else 0
+    
+    # The session list normally extends what is stored; if it was cleared or
+    # replaced (e.g. a history snapshot was loaded), rewrite the tab once
+    if stored > len(chat_data) or (last and (chat_data[last[0]].get("role"), str(chat_data[last[0]].get("content", ""))) != (last[1], last[2])):
+        conn.execute('DELETE FROM messages WHERE user_id = ? AND tab_name = ?', (user_id, tab_name))
+        stored = 0
+    
+    conn.executemany(INSERT_MESSAGE, [message_row(user_id, tab_name, seq, chat_data[seq])
+                                      for seq in range(stored, len(chat_data))])
+
+def save_user_chat(user_id, tab_name, chat_data, errors=None):
+    """
+    Persist a tab's messages: only the ones not stored yet are inserted.
+    :param errors: list receiving a message if the queued write fails later
+    """
+    try:
+        # Copy: the session keeps appending to its list while the save is queued
+        snapshot = list(chat_data)
+        _submit_tab_write(
+            user_id, tab_name,
+            lambda conn: _write_user_chat(conn, user_id, tab_name, snapshot),
+            errors, f"Could not save '{tab_name}'",
+            key=("chat", user_id, tab_name)
+        )
         return True
     except Exception as e:
         return False
-    finally:
-        conn.close()
 
-def load_user_chats(user_id):
+def _write_rename(conn, user_id, old_name, new_name):
+    conn.execute('UPDATE user_chats SET tab_name = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ? AND tab_name = ?',
+                 (new_name, user_id, old_name))
+    conn.execute('UPDATE messages SET tab_name = ? WHERE user_id = ? AND tab_name = ?',
+                 (new_name, user_id, old_name))
+    conn.execute('UPDATE chat_history SET tab_name = ? WHERE user_id = ? AND tab_name = ?',
+                 (new_name, user_id, old_name))
+
+def rename_user_chat(user_id, old_name, new_name):
+    """
+    Rename a tab. Synchronous (renames are rare), so a failure such as a
+    taken name reaches the caller before the session is changed.
+    :return: False if the rename was not stored
+    """
     try:
-        conn = sqlite3.connect('medichat.db')
-        c = conn.cursor()
-        c.execute('SELECT tab_name, chat_data FROM user_chats WHERE user_id = ?', (user_id,))
-        rows = c.fetchall()
+        writer.flush()  # saves queued under the old name land first
+        with db.transaction() as conn:
+            _write_rename(conn, user_id, old_name, new_name)
+        db.read_cache.bump(user_id, old_name)
+        db.read_cache.bump(user_id, new_name)
+        return True
+    except Exception as e:
+        print(f"❌ Could not rename '{old_name}' to '{new_name}': {e}")
+        return False
+
+def load_user_tabs(user_id):
+    """Tab list with name, last update and message count; no message content is read."""
+    try:
+        with db.connection() as conn:
+            rows = conn.execute('''SELECT uc.tab_name, uc.updated_at, COUNT(m.seq)
+                                   FROM user_chats uc
+                                   LEFT JOIN messages m ON m.user_id = uc.user_id AND m.tab_name = uc.tab_name
+                                   WHERE uc.user_id = ?
+                                   GROUP BY uc.id ORDER BY uc.id''', (user_id,)).fetchall()
+        return {row[0]: {"updated_at": row[1], "message_count": row[2]} for row in rows}
+    except:
+        return {}
+
+def load_tab_messages(user_id, tab_name):
+    try:
+        with db.connection() as conn:
+            rows = conn.execute('''SELECT role, content, timestamp, attachments FROM messages
+                                   WHERE user_id = ? AND tab_name = ? ORDER BY seq''',
+                                (user_id, tab_name)).fetchall()
         
-        tabs = {}
+        messages = []
         for row in rows:
             try:
-                chat_data = json.loads(row[1]) if row[1] else []
-                tabs[row[0]] = chat_data
+                messages.append(row_to_message(*row))
             except:
-                tabs[row[0]] = []
+                continue
         
-        return tabs
+        return messages
     except:
-        return {}
-    finally:
-        conn.close()
+        return []
 
-def save_user_files(user_id, tab_name, uploaded_files):
+def save_user_files(user_id, tab_name, uploaded_files, errors=None):
     try:
-        conn = sqlite3.connect('medichat.db')
-        c = conn.cursor()
-        
+        # Stream the uploads into the file store before taking the write lock
+        rows = []
         for uploaded_file in uploaded_files:
-            file_content = uploaded_file.read()
-            c.execute('''INSERT INTO user_files (user_id, tab_name, file_name, file_content, file_type)
-                        VALUES (?, ?, ?, ?, ?)''',
-                     (user_id, tab_name, uploaded_file.name, file_content, uploaded_file.type))
-        
-        conn.commit()
+            uploaded_file.seek(0)
+            sha256, size = file_store.put(uploaded_file, uploaded_file.type)
+            rows.append((user_id, tab_name, uploaded_file.name, uploaded_file.type, sha256, size))
+        _submit_tab_write(
+            user_id, tab_name,
+            lambda conn: conn.executemany('''INSERT INTO user_files (user_id, tab_name, file_name, file_type, sha256, size)
+                                             VALUES (?, ?, ?, ?, ?, ?)''', rows),
+            errors, f"Could not attach files to '{tab_name}'"
+        )
         return True
     except:
         return False
-    finally:
-        conn.close()
 
 def get_user_files(user_id, tab_name):
+    def query():
+        with db.connection() as conn:
+            return conn.execute('SELECT file_name, file_type FROM user_files WHERE user_id = ? AND tab_name = ?',
+                                (user_id, tab_name)).fetchall()
     try:
-        conn = sqlite3.connect('medichat.db')
-        c = conn.cursor()
-        c.execute('SELECT file_name, file_type FROM user_files WHERE user_id = ? AND tab_name = ?',
-                 (user_id, tab_name))
-        return c.fetchall()
+        # Served from memory until save_user_files queues a write for the tab
+        return _read_tab("files", user_id, tab_name, query)
     except:
         return []
-    finally:
-        conn.close()
 
-def save_chat_history(user_id, tab_name, history_data):
+# History retention: snapshots kept per tab, maximum age, pruning interval
+HISTORY_KEEP_PER_TAB = int(os.getenv("MEDICHAT_HISTORY_KEEP", "20"))
+HISTORY_MAX_AGE_DAYS = int(os.getenv("MEDICHAT_HISTORY_MAX_AGE_DAYS", "90"))
+HISTORY_PRUNE_SECONDS = int(os.getenv("MEDICHAT_HISTORY_PRUNE_SECONDS", "3600"))
+
+def save_chat_history(user_id, tab_name, history_data, errors=None):
+    """
+    Record a history snapshot. Only the messages added since the tab's previous
+    snapshot are stored, linked to it by parent_id; a snapshot that does not
+    extend the previous one (cleared or replaced tab) stores the full list.
+    """
     try:
-        conn = sqlite3.connect('medichat.db')
-        c = conn.cursor()
-        history_json = json.dumps(history_data, default=str)
-        
-        c.execute('''INSERT INTO chat_history (user_id, tab_name, history_data)
-                    VALUES (?, ?, ?)''',
-                 (user_id, tab_name, history_json))
-        
-        conn.commit()
+        history_data = dict(history_data, messages=list(history_data.get("messages", [])))
+        _submit_tab_write(
+            user_id, tab_name,
+            lambda conn: _write_chat_history(conn, user_id, tab_name, history_data),
+            errors, f"Could not save the history of '{tab_name}'"
+        )
         return True
     except:
         return False
-    finally:
-        conn.close()
+
+def _write_chat_history(conn, user_id, tab_name, history_data):
+    messages = history_data["messages"]
+    previous = conn.execute('''SELECT id, end_seq, history_data FROM chat_history
+                               WHERE user_id = ? AND tab_name = ?
+                               ORDER BY id DESC LIMIT 1''',
+                            (user_id, tab_name)).fetchone()
+    parent_id, start = None, 0
+    if previous and previous[1] and previous[1] <= len(messages):
+        previous_delta = json.loads(previous[2]).get("messages", [])
+        if previous_delta and previous_delta[-1].get("content") == messages[previous[1] - 1].get("content"):
+            parent_id, start = previous[0], previous[1]
+    if parent_id and start == len(messages):
+        return  # nothing new since the previous snapshot
+    
+    delta = dict(history_data, messages=messages[start:])
+    conn.execute('''INSERT INTO chat_history (user_id, tab_name, history_data, parent_id, end_seq, user_message)
+                    VALUES (?, ?, ?, ?, ?, ?)''',
+                 (user_id, tab_name, json.dumps(delta, default=str), parent_id, len(messages),
+                  history_data.get("user_message", "")))
+
+def search_messages(user_id, query, limit=20):
+    """
+    Ranked full-text search over a user's messages.
+    :return: list of (tab_name, seq, role, snippet), best match first
+    """
+    # Quote every word so user input can't be parsed as FTS5 syntax; the last
+    # word is a prefix so results appear while typing
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if not terms:
+        return []
+    terms[-1] += "*"
+    # Restricting on the indexed user_id column inside MATCH keeps other users'
+    # messages out of ranking; bm25 weighs only the content column
+    match = f'user_id : "{int(user_id)}" AND content : ({" ".join(terms)})'
+    try:
+        writer.flush()
+        with db.connection() as conn:
+            return conn.execute('''SELECT m.tab_name, m.seq, m.role,
+                                          snippet(messages_fts, 0, '**', '**', '…', 12)
+                                   FROM messages_fts
+                                   JOIN messages m ON m.id = messages_fts.rowid
+                                   WHERE messages_fts MATCH ?
+                                   ORDER BY bm25(messages_fts, 1.0, 0.0)
+                                   LIMIT ?''',
+                                (match, limit)).fetchall()
+    except sqlite3.OperationalError:
+        return []
 
 def load_chat_history(user_id, tab_name):
+    """Latest snapshots of a tab for the sidebar, served from the covering index."""
+    def query():
+        with db.connection() as conn:
+            rows = conn.execute('''SELECT id, user_message, created_at FROM chat_history 
+                                   WHERE user_id = ? AND tab_name = ? 
+                                   ORDER BY created_at DESC, id DESC LIMIT 5''',
+                                (user_id, tab_name)).fetchall()
+        return [{"id": row[0], "user_message": row[1] or "", "timestamp": row[2]} for row in rows]
     try:
-        conn = sqlite3.connect('medichat.db')
-        c = conn.cursor()
-        c.execute('''SELECT history_data FROM chat_history 
-                    WHERE user_id = ? AND tab_name = ? 
-                    ORDER BY created_at DESC LIMIT 5''',
-                 (user_id, tab_name))
-        rows = c.fetchall()
-        
-        history = []
-        for row in rows:
-            try:
-                history_data = json.loads(row[0])
-                history.append(history_data)
-            except:
-                continue
-        
-        return history
+        # Served from memory until save_chat_history queues a write for the tab (or pruning bumps it)
+        return _read_tab("history", user_id, tab_name, query)
+    except:
+        return []
+
+def _history_chain(conn, user_id, tab_name, history_id):
+    # Deltas from the root snapshot to history_id, oldest first
+    rows = conn.execute('''SELECT id, parent_id, history_data FROM chat_history
+                           WHERE user_id = ? AND tab_name = ? AND id <= ?''',
+                        (user_id, tab_name, history_id)).fetchall()
+    by_id = {row[0]: row for row in rows}
+    chain = []
+    node = by_id.get(history_id)
+    while node:
+        chain.append(json.loads(node[2]).get("messages", []))
+        node = by_id.get(node[1]) if node[1] else None
+    return chain[::-1]
+
+def load_history_messages(user_id, tab_name, history_id):
+    """Rebuild the full message list of one snapshot."""
+    try:
+        with db.connection() as conn:
+            chain = _history_chain(conn, user_id, tab_name, history_id)
+        return [message for delta in chain for message in delta]
     except:
         return []
-    finally:
-        conn.close()
+
+def prune_chat_history(keep=HISTORY_KEEP_PER_TAB, max_age_days=HISTORY_MAX_AGE_DAYS):
+    """
+    Apply the retention policy: per tab, keep the newest ``keep`` snapshots that
+    are younger than ``max_age_days``. The oldest kept snapshot is folded into a
+    full copy first, so the deltas it depended on can be deleted.
+    :return: number of snapshots deleted
+    """
+    deleted = 0
+    with db.connection() as conn:
+        tabs = conn.execute('SELECT DISTINCT user_id, tab_name FROM chat_history').fetchall()
+    for user_id, tab_name in tabs:
+        with db.transaction() as conn:
+            kept = conn.execute('''SELECT id FROM chat_history
+                                   WHERE user_id = ? AND tab_name = ? AND created_at >= datetime('now', ?)
+                                   ORDER BY id DESC LIMIT ?''',
+                                (user_id, tab_name, f"-{max_age_days} days", keep)).fetchall()
+            oldest_kept = kept[-1][0] if kept else None
+            if oldest_kept:
+                row = conn.execute('SELECT parent_id, history_data FROM chat_history WHERE id = ?', (oldest_kept,)).fetchone()
+                if row[0]:
+                    chain = _history_chain(conn, user_id, tab_name, oldest_kept)
+                    full = dict(json.loads(row[1]), messages=[message for delta in chain for message in delta])
+                    conn.execute('UPDATE chat_history SET parent_id = NULL, history_data = ? WHERE id = ?',
+                                 (json.dumps(full, default=str), oldest_kept))
+                cursor = conn.execute('DELETE FROM chat_history WHERE user_id = ? AND tab_name = ? AND id < ?',
+                                      (user_id, tab_name, oldest_kept))
+            else:
+                cursor = conn.execute('DELETE FROM chat_history WHERE user_id = ? AND tab_name = ?', (user_id, tab_name))
+            deleted += cursor.rowcount
+        if cursor.rowcount:
+            db.read_cache.bump(user_id, tab_name)
+    return deleted
+
+@st.cache_resource
+def start_history_pruner():
+    """One background pruning thread per server process (survives reruns)."""
+    def loop():
+        while True:
+            try:
+                prune_chat_history()
+            except Exception as e:
+                print(f"⚠️ History pruning failed: {e}")
+            time.sleep(HISTORY_PRUNE_SECONDS)
+    
+    thread = threading.Thread(target=loop, name="history-pruner", daemon=True)
+    thread.start()
+    return thread
+
+start_history_pruner()
 
 # Custom CSS - DARK THEME
 st.markdown("""
@@ -773,6 +1171,10 @@ def init_session_state():
         'show_login': True,
         'show_register': False,
         'tabs': {},
+        'tab_meta': {},
+        'tab_last_used': {},
+        'render_window': {},
+        'message_html': {},
         'current_tab': None,
         'chat_history': {},
         'tab_counter': 1,
@@ -780,7 +1182,10 @@ def init_session_state():
         'editing_tab': None,
         'temp_files': [],
         'first_message_sent': False,
-        'default_tab_created': False
+        'default_tab_created': False,
+        'write_errors': [],
+        'pending_cookie': None,
+        'session_cookie_checked': False
     }
     
     for key, value in defaults.items():
@@ -792,6 +1197,8 @@ init_session_state()
 # Function to clear non-persistent data
 def clear_temporary_data():
     st.session_state.tabs = {}
+    st.session_state.tab_meta = {}
+    st.session_state.tab_last_used = {}
     st.session_state.current_tab = None
     st.session_state.chat_history = {}
     st.session_state.tab_counter = 1
@@ -799,6 +1206,77 @@ def clear_temporary_data():
     st.session_state.first_message_sent = False
     st.session_state.default_tab_created = False
 
+# Lazy tabs: st.session_state.tabs maps every tab name to its message list,
+# or to None while the messages are not loaded
+TAB_IDLE_SECONDS = int(os.getenv("MEDICHAT_TAB_IDLE_SECONDS", "600"))
+MAX_LOADED_TABS = int(os.getenv("MEDICHAT_MAX_LOADED_TABS", "5"))
+
+def load_tab_list(user_id):
+    writer.flush()  # queued saves must be visible before reading them back
+    st.session_state.tab_meta = load_user_tabs(user_id)
+    st.session_state.tabs = {tab_name: None for tab_name in st.session_state.tab_meta}
+    st.session_state.tab_last_used = {}
+    st.session_state.current_tab = next(iter(st.session_state.tabs), None)
+
+def get_tab_messages(tab_name):
+    """Messages of a tab, loaded from the database the first time it is opened."""
+    if tab_name not in st.session_state.tabs:
+        return []
+    messages = st.session_state.tabs[tab_name]
+    if messages is None:
+        writer.flush()
+        messages = load_tab_messages(st.session_state.user_id, tab_name)
+        st.session_state.tabs[tab_name] = messages
+    st.session_state.tab_last_used[tab_name] = time.time()
+    return messages
+
+def evict_idle_tabs():
+    """Drop the messages of idle tabs; every turn is already persisted, so they reload on demand."""
+    if not st.session_state.user_id:
+        return  # guest tabs exist only in the session
+    now = time.time()
+    last_used = st.session_state.tab_last_used
+    loaded = sorted(
+        (name for name, messages in st.session_state.tabs.items()
+         if messages is not None and name != st.session_state.current_tab),
+        key=lambda name: last_used.get(name, 0),
+        reverse=True
+    )
+    for rank, name in enumerate(loaded):
+        if rank >= MAX_LOADED_TABS - 1 or now - last_used.get(name, 0) > TAB_IDLE_SECONDS:
+            st.session_state.tabs[name] = None
+
+# Windowed rendering: messages shown per page of a conversation
+MESSAGE_WINDOW = int(os.getenv("MEDICHAT_MESSAGE_WINDOW", "30"))
+
+def message_hash(message):
+    content = f'{message.get("role")}\x00{message.get("content")}\x00{message.get("attachments", "")}'
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def render_message_html(message):
+    if message["role"] == "user":
+        attachments_html = ""
+        if "attachments" in message:
+            attachments_html = '<div style="margin-top: 10px; font-size: 0.9em; display: flex; flex-wrap: wrap; gap: 5px;">'
+            for att in message["attachments"]:
+                attachments_html += f'<div style="background: rgba(255,255,255,0.1); padding: 4px 8px; border-radius: 12px; font-size: 0.85em;">📎 {att[:15]}{"..." if len(att) > 15 else ""}</div>'
+            attachments_html += '</div>'
+        # No indentation: markdown would turn indented lines into code blocks
+        return (
+            '<div class="user-message message-animation">'
+            '<strong style="display: flex; align-items: center; gap: 8px; margin-bottom: 8px;">'
+            '<span style="background: white; width: 24px; height: 24px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-size: 12px; color: #6366f1;">👤</span>'
+            'You</strong>'
+            f'<div>{message["content"]}</div>{attachments_html}</div>\n'
+        )
+    return (
+        '<div class="assistant-message message-animation">'
+        '<strong style="display: flex; align-items: center; gap: 8px; margin-bottom: 8px;">'
+        '<span style="background: #6366f1; width: 24px; height: 24px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-size: 12px; color: white;">🏥</span>'
+        'MediAssist</strong>'
+        f'<div>{message["content"]}</div></div>\n'
+    )
+
 # Function to create tab name from first question
 def create_tab_name_from_question(question):
     question = question.strip()
@@ -829,24 +1307,28 @@ def show_login():
     with col1:
         if st.button("Login", use_container_width=True, type="primary"):
             if username and password:
-                user_data = login_user(username, password)
+                try:
+                    user_data = login_user(username, password)
+                except auth.Throttled as e:
+                    user_data = None
+                    st.error(f"Too many failed attempts. Please try again in {int(e.retry_after) + 1} seconds.")
+                except auth.AuthBusy:
+                    user_data = None
+                    st.error("The server is busy, please try again in a moment.")
+                else:
+                    if not user_data:
+                        st.error("Invalid username or password")
                 if user_data:
                     st.session_state.authenticated = True
                     st.session_state.user_id = user_data[0]
                     st.session_state.username = user_data[1]
+                    # Survives reloads and reconnects: the next session resumes without bcrypt
+                    st.session_state.pending_cookie = (user_data[2], auth.SESSION_TTL)
                     
-                    user_tabs = load_user_chats(user_data[0])
-                    if user_tabs:
-                        st.session_state.tabs = user_tabs
-                        st.session_state.current_tab = list(st.session_state.tabs.keys())[0]
-                    else:
-                        st.session_state.tabs = {}
-                        st.session_state.current_tab = None
+                    load_tab_list(user_data[0])
                     
                     st.success(f"Welcome back, {user_data[1]}!")
                     st.rerun()
-                else:
-                    st.error("Invalid username or password")
             else:
                 st.warning("Please fill in all fields")
     
@@ -886,12 +1368,17 @@ def show_register():
                 elif len(password) < 6:
                     st.error("Password must be at least 6 characters")
                 else:
-                    if register_user(username, email, password):
+                    try:
+                        registered = register_user(username, email, password)
+                    except auth.AuthBusy:
+                        registered = None
+                        st.error("The server is busy, please try again in a moment.")
+                    if registered:
                         st.success("Account created successfully! Please login.")
                         st.session_state.show_register = False
                         st.session_state.show_login = True
                         st.rerun()
-                    else:
+                    elif registered is False:
                         st.error("Username or email already exists")
             else:
                 st.warning("Please fill in all fields")
@@ -909,21 +1396,23 @@ def show_register():
 def main_app():
     if 'user_tabs_loaded' not in st.session_state:
         if st.session_state.authenticated and st.session_state.user_id:
-            user_tabs = load_user_chats(st.session_state.user_id)
-            if user_tabs:
-                st.session_state.tabs = user_tabs
-                st.session_state.current_tab = list(st.session_state.tabs.keys())[0]
+            load_tab_list(st.session_state.user_id)
         st.session_state.user_tabs_loaded = True
     
+    # Background writes of this session that failed since the last rerun
+    while st.session_state.write_errors:
+        st.error(f"⚠️ {st.session_state.write_errors.pop(0)}")
+    
     # Function to save current tab data
     def save_current_tab():
         if st.session_state.authenticated and st.session_state.user_id and st.session_state.current_tab:
+            current_messages = get_tab_messages(st.session_state.current_tab)
             save_user_chat(
                 st.session_state.user_id,
                 st.session_state.current_tab,
-                st.session_state.tabs.get(st.session_state.current_tab, [])
+                current_messages,
+                errors=st.session_state.write_errors
             )
-            current_messages = st.session_state.tabs.get(st.session_state.current_tab, [])
             if current_messages:
                 last_message = current_messages[-1] if current_messages else {}
                 if last_message.get("role") == "assistant":
@@ -934,7 +1423,8 @@ def main_app():
                             "timestamp": dt.now().isoformat(),
                             "user_message": current_messages[-2]["content"][:100] if len(current_messages) >= 2 else "",
                             "messages": current_messages.copy()
-                        }
+                        },
+                        errors=st.session_state.write_errors
                     )
     
     # Function to create a new tab with auto-naming
@@ -957,7 +1447,18 @@ def main_app():
     # Function to rename tab
     def rename_tab(old_name, new_name):
         if new_name and new_name != old_name:
+            # Tab names are unique per user (UNIQUE(user_id, tab_name)); never overwrite another tab
+            if new_name in st.session_state.tabs:
+                st.error(f"A conversation named '{new_name}' already exists")
+                return
+            if st.session_state.authenticated and st.session_state.user_id:
+                if not rename_user_chat(st.session_state.user_id, old_name, new_name):
+                    st.error(f"Could not rename '{old_name}', please try again")
+                    return
             st.session_state.tabs[new_name] = st.session_state.tabs.pop(old_name)
+            for state in (st.session_state.tab_meta, st.session_state.tab_last_used):
+                if old_name in state:
+                    state[new_name] = state.pop(old_name)
             
             if st.session_state.current_tab == old_name:
                 st.session_state.current_tab = new_name
@@ -987,12 +1488,14 @@ def main_app():
         
         # Logout button
         if st.button("🚪 Logout", use_container_width=True, type="secondary"):
+            writer.flush()  # everything of this session is on disk before it ends
             if st.session_state.username == "Guest":
                 clear_temporary_data()
             st.session_state.authenticated = False
             st.session_state.user_id = None
             st.session_state.username = None
             st.session_state.user_tabs_loaded = False
+            st.session_state.pending_cookie = ("", 0)  # expire the session cookie
             st.rerun()
         
         st.write("---")
@@ -1003,6 +1506,24 @@ def main_app():
             tab_name = create_new_tab()
             st.rerun()
         
+        # Full-text search across this user's conversations
+        if st.session_state.user_id:
+            search_query = st.text_input("🔎 Search conversations", key="chat_search",
+                                         placeholder="Search your chats...")
+            if search_query.strip():
+                results = search_messages(st.session_state.user_id, search_query.strip())
+                if not results:
+                    st.caption("No matches")
+                for result_tab, seq, role, snippet in results:
+                    speaker = "You" if role == "user" else "MediAssist"
+                    st.markdown(f"**{result_tab[:25]}** · {speaker}, turn {seq // 2 + 1}  \n{snippet}")
+                    if result_tab in st.session_state.tabs and st.button("Open", key=f"search_{result_tab}_{seq}"):
+                        switch_tab(result_tab)
+                        # Widen the render window so the matching message is on screen
+                        total = len(get_tab_messages(result_tab))
+                        st.session_state.render_window[result_tab] = max(MESSAGE_WINDOW, total - seq)
+                        st.rerun()
+        
         st.write("---")
         
         # Display tabs if any exist
@@ -1032,9 +1553,11 @@ def main_app():
                     with col1:
                         display_name = tab_name[:25] + "..." if len(tab_name) > 25 else tab_name
                         btn_label = f"● {display_name}" if is_active else f"○ {display_name}"
+                        loaded = st.session_state.tabs[tab_name]
+                        message_count = len(loaded) if loaded is not None else st.session_state.tab_meta.get(tab_name, {}).get("message_count", 0)
                         if st.button(btn_label, 
                                    key=f"btn_{tab_name}",
-                                   help=f"Switch to {tab_name}",
+                                   help=f"Switch to {tab_name} ({message_count} messages)",
                                    use_container_width=True):
                             switch_tab(tab_name)
                             st.rerun()
@@ -1061,7 +1584,10 @@ def main_app():
                     with st.expander(f"Chat {len(history)-i}"):
                         st.write(f"**Q:** {chat.get('user_message', '')[:50]}...")
                         if st.button(f"Load", key=f"load_{i}_{st.session_state.current_tab}"):
-                            st.session_state.tabs[st.session_state.current_tab] = chat.get('messages', [])
+                            writer.flush()
+                            st.session_state.tabs[st.session_state.current_tab] = load_history_messages(
+                                st.session_state.user_id, st.session_state.current_tab, chat['id']
+                            )
                             st.rerun()
             else:
                 st.caption("No history yet")
@@ -1081,7 +1607,8 @@ def main_app():
         st.markdown(f'<h1 style="color: var(--accent-primary); margin-bottom: 1.5rem; text-shadow: 0 2px 10px rgba(99, 102, 241, 0.3);">{st.session_state.current_tab}</h1>', unsafe_allow_html=True)
     
     # Welcome message for empty chat
-    current_messages = st.session_state.tabs.get(st.session_state.current_tab, []) if st.session_state.current_tab else []
+    current_messages = get_tab_messages(st.session_state.current_tab) if st.session_state.current_tab else []
+    evict_idle_tabs()
     
     if not current_messages:
         st.markdown('''
@@ -1105,35 +1632,29 @@ def main_app():
     # Chat messages container
     st.markdown('<div class="chat-container" id="chat-container">', unsafe_allow_html=True)
     
-    for i, message in enumerate(current_messages):
-        if message["role"] == "user":
-            st.markdown(f'''
-                <div class="user-message message-animation">
-                    <strong style="display: flex; align-items: center; gap: 8px; margin-bottom: 8px;">
-                        <span style="background: white; width: 24px; height: 24px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-size: 12px; color: #6366f1;">👤</span>
-                        You
-                    </strong>
-                    <div>{message["content"]}</div>
-            ''', unsafe_allow_html=True)
-            
-            if "attachments" in message:
-                attachments_html = '<div style="margin-top: 10px; font-size: 0.9em; display: flex; flex-wrap: wrap; gap: 5px;">'
-                for att in message["attachments"]:
-                    attachments_html += f'<div style="background: rgba(255,255,255,0.1); padding: 4px 8px; border-radius: 12px; font-size: 0.85em;">📎 {att[:15]}{"..." if len(att) > 15 else ""}</div>'
-                attachments_html += '</div>'
-                st.markdown(attachments_html, unsafe_allow_html=True)
-            
-            st.markdown('</div>', unsafe_allow_html=True)
-        else:
-            st.markdown(f'''
-                <div class="assistant-message message-animation">
-                    <strong style="display: flex; align-items: center; gap: 8px; margin-bottom: 8px;">
-                        <span style="background: #6366f1; width: 24px; height: 24px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-size: 12px; color: white;">🏥</span>
-                        MediAssist
-                    </strong>
-                    <div>{message["content"]}</div>
-                </div>
-            ''', unsafe_allow_html=True)
+    # Only the last messages are rendered; earlier ones are paged in on request
+    window = st.session_state.render_window.get(st.session_state.current_tab, MESSAGE_WINDOW)
+    start = max(0, len(current_messages) - window)
+    if start > 0:
+        if st.button(f"⬆️ Load earlier messages ({start} hidden)", key=f"load_earlier_{st.session_state.current_tab}",
+                     use_container_width=True):
+            st.session_state.render_window[st.session_state.current_tab] = window + MESSAGE_WINDOW
+            st.rerun()
+    
+    # HTML is built once per message, keyed by (tab, position, content hash);
+    # only the visible window is kept, so the cache stays bounded
+    html_cache = st.session_state.message_html
+    visible_cache = {}
+    for i in range(start, len(current_messages)):
+        message = current_messages[i]
+        key = (st.session_state.current_tab, i, message_hash(message))
+        html = html_cache.get(key)
+        if html is None:
+            html = render_message_html(message)
+        visible_cache[key] = html
+        # One call per message: unbalanced markdown (e.g. an unclosed ``` fence) stays inside its message
+        st.markdown(html, unsafe_allow_html=True)
+    st.session_state.message_html = visible_cache
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -1208,7 +1729,8 @@ def main_app():
                         save_user_files(
                             st.session_state.user_id,
                             st.session_state.current_tab,
-                            uploaded_files
+                            uploaded_files,
+                            errors=st.session_state.write_errors
                         )
                     
                     file_names = [f.name for f in uploaded_files]
@@ -1247,7 +1769,7 @@ def main_app():
         
         if st.session_state.current_tab not in st.session_state.tabs:
             st.session_state.tabs[st.session_state.current_tab] = []
-        st.session_state.tabs[st.session_state.current_tab].append(user_message)
+        get_tab_messages(st.session_state.current_tab).append(user_message)
         
         with st.spinner("🌙 MediAssist is thinking..."):
             if llm_available:
@@ -1260,7 +1782,7 @@ def main_app():
             "content": response,
             "timestamp": dt.now().isoformat()
         }
-        st.session_state.tabs[st.session_state.current_tab].append(assistant_message)
+        get_tab_messages(st.session_state.current_tab).append(assistant_message)
         
         save_current_tab()
         st.session_state.show_file_dialog = False
@@ -1299,6 +1821,21 @@ def main_app():
 
 # Main application flow
 def main():
+    # Cookies are sent once, when the session connects: try them once per session
+    if not st.session_state.session_cookie_checked:
+        st.session_state.session_cookie_checked = True
+        token = st.context.cookies.get(SESSION_COOKIE)
+        if token and not st.session_state.authenticated:
+            user_data = resume_session(token, client_fingerprint())
+            if user_data:
+                st.session_state.authenticated = True
+                st.session_state.user_id = user_data[0]
+                st.session_state.username = user_data[1]  # main_app loads the tab list
+            else:
+                st.session_state.pending_cookie = ("", 0)
+    if st.session_state.pending_cookie is not None:
+        write_session_cookie(*st.session_state.pending_cookie)
+        st.session_state.pending_cookie = None
     if not st.session_state.authenticated:
         if st.session_state.show_login:
             show_login()
@@ -5,6 +5,68 @@ import os
 import hashlib
 from typing import List, Dict, Any
 import numpy as np
+from embedding import get_embedder
+from hnsw_config import collection_metadata, model_matches
+
+class _BatchLoader:
+    """Fetches documents and metadata for all winning ids of one collection in a single get."""
+    __slots__ = ('collection', 'ids', 'rows')
+
+    def __init__(self, collection) -> None:
+        self.collection = collection
+        self.ids = []
+        self.rows = None
+
+    def load(self) -> None:
+        if self.rows is None:
+            data = self.collection.get(ids=self.ids, include=['documents', 'metadatas'])
+            metadatas = data.get('metadatas') or [None] * len(data['ids'])
+            self.rows = {i: (d, m or {}) for i, d, m in zip(data['ids'], data['documents'], metadatas)}
+
+    def row(self, doc_id: str) -> tuple:
+        self.load()
+        return self.rows.get(doc_id, ('', {}))
+
+
+class SearchHit:
+    """
+    Compact search result. Document and metadata come from a batched loader
+    shared by the hits of one collection; supports the dict-style access of the former result dicts (hit['document']).
+    """
+    __slots__ = ('id', 'distance', 'source', '_loader')
+    _KEYS = ('id', 'document', 'metadata', 'distance', 'source')
+
+    def __init__(self, doc_id: str, distance: float, source: str, loader: _BatchLoader) -> None:
+        self.id = doc_id
+        self.distance = distance
+        self.source = source
+        self._loader = loader
+
+    @property
+    def document(self) -> str:
+        return self._loader.row(self.id)[0]
+
+    @property
+    def metadata(self) -> Dict:
+        return self._loader.row(self.id)[1]
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._KEYS else default
+
+    def keys(self) -> tuple:
+        return self._KEYS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self._KEYS}
+
+    def __repr__(self) -> str:
+        return f"SearchHit(id={self.id!r}, distance={self.distance:.4f}, source={self.source!r})"
+
 
 class RegPipeline:
     def __init__(self, collection_name: str = "medical_documents") -> None:
@@ -17,15 +79,18 @@ class RegPipeline:
             if not os.path.exists(chroma_path):
                 os.makedirs(chroma_path)
 
+            # (collection name, model id) -> whether their vectors are compatible
+            self._model_checks = {}
+
             self.client = v_db.PersistentClient(
                 path=chroma_path,
                 settings=setting(anonymized_telemetry=False)
             )
 
-            # Get or create main collection
+            # Get or create main collection, recording the embedder its vectors will come from
             self.collection = self.client.get_or_create_collection(
                 name=collection_name,
-                metadata={"hnsw:space": "cosine"}
+                metadata=collection_metadata(collection_name, get_embedder().model_id)
             )
             
             # Try to get the PubMed collection
@@ -46,60 +111,81 @@ class RegPipeline:
         Search across collections.
         """
         try:
-            # Use ChromaDB's built-in embeddings
-            all_results = []
+            # Embed the question once (with the configured backend) and reuse it for every collection;
+            # queries stay out of the persistent embedding cache
+            embedder = get_embedder()
+            query_embedding = embedder.encode([query], cache=False)[0]
             
-            # Search main collection
-            main_count = self.collection.count()
+            # Phase 1: rank on ids and distances only, no documents or metadata
+            candidates = []
+            main_count = self.collection.count() if self._searchable(self.collection, embedder.model_id) else 0
             if main_count > 0:
-                main_results = self.collection.query(
-                    query_texts=[query],
-                    n_results=top_k if not use_both else top_k * 2
-                )
-                if main_results and main_results['ids']:
-                    for i in range(len(main_results['ids'][0])):
-                        result = {
-                            'id': main_results['ids'][0][i],
-                            'document': main_results['documents'][0][i],
-                            'metadata': main_results['metadatas'][0][i] if main_results['metadatas'] and i < len(main_results['metadatas'][0]) else {},
-                            'distance': main_results['distances'][0][i],
-                            'source': 'main_collection'
-                        }
-                        all_results.append(result)
-            
+                candidates += self._rank(self.collection, 'main_collection', query_embedding, top_k if not use_both else top_k * 2)
+
             # Search PubMed collection if enabled
-            if use_both and self.pubmed_collection and self.pubmed_collection.count() > 0:
-                pubmed_results = self.pubmed_collection.query(
-                    query_texts=[query],
-                    n_results=top_k if main_count == 0 else top_k * 2
-                )
-                if pubmed_results and pubmed_results['ids']:
-                    for i in range(len(pubmed_results['ids'][0])):
-                        result = {
-                            'id': pubmed_results['ids'][0][i],
-                            'document': pubmed_results['documents'][0][i],
-                            'metadata': pubmed_results['metadatas'][0][i] if pubmed_results['metadatas'] and i < len(pubmed_results['metadatas'][0]) else {},
-                            'distance': pubmed_results['distances'][0][i],
-                            'source': 'pubmed_collection'
-                        }
-                        all_results.append(result)
-            
-            # Sort by distance (lower is better)
-            all_results.sort(key=lambda x: x['distance'])
-            return all_results[:top_k]
+            if use_both and self.pubmed_collection and self._searchable(self.pubmed_collection, embedder.model_id) \
+                    and self.pubmed_collection.count() > 0:
+                candidates += self._rank(self.pubmed_collection, 'pubmed_collection', query_embedding, top_k if main_count == 0 else top_k * 2)
+
+            # Sort by distance (lower is better) and keep the winners
+            candidates.sort(key=lambda x: x[1])
+            winners = candidates[:top_k]
+
+            # Phase 2: one batched get per collection for the winners only
+            loaders = {}
+            results = []
+            for doc_id, distance, source, collection in winners:
+                if source not in loaders:
+                    loaders[source] = _BatchLoader(collection)
+                loaders[source].ids.append(doc_id)
+                results.append(SearchHit(doc_id, distance, source, loaders[source]))
+            # Fetched here rather than on first access, so a failing get is handled below
+            for loader in loaders.values():
+                loader.load()
+            return results
             
         except Exception as e:
             print(f"❌ Error in search: {e}")
             return []
 
+    def _searchable(self, collection, model_id: str) -> bool:
+        """
+        Whether query vectors of ``model_id`` are comparable with the collection's;
+        a mismatch is reported once and the collection is left out of searches.
+        """
+        key = (collection.name, model_id)
+        if key not in self._model_checks:
+            self._model_checks[key] = model_matches(collection, model_id)
+        return self._model_checks[key]
+
+    @staticmethod
+    def _rank(collection, source: str, query_embedding: List[float], n_results: int) -> list:
+        """
+        Nearest ids of one collection as (id, distance, source, collection) tuples.
+        """
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=['distances']
+        )
+        if not results or not results['ids']:
+            return []
+        return [(doc_id, distance, source, collection) for doc_id, distance in zip(results['ids'][0], results['distances'][0])]
+
     def add_document(self, text: str, metadata: Dict = None):
         """Add a document to the collection"""
         try:
             doc_id = f"doc_{hashlib.md5(text.encode()).hexdigest()[:16]}"
+            # Shared embedder: already-seen text is served from the embedding cache
+            embedder = get_embedder()
+            if not self._searchable(self.collection, embedder.model_id):
+                return False
+            embedding = embedder.encode([text])[0]
             self.collection.add(
                 ids=[doc_id],
                 documents=[text],
-                metadatas=[metadata] if metadata else [{}]
+                metadatas=[metadata] if metadata else [{}],
+                embeddings=[embedding]
             )
             return True
         except Exception as e:
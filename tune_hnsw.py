@@ -0,0 +1,135 @@
+"""
+Tune HNSW parameters for a collection: build candidate indexes from its
+vectors, measure recall@k against exact brute-force search, p50/p99 query
+latency and memory, then optionally save the best setting for future
+(re)creations of the collection (see hnsw_config.py).
+
+Usage:
+    python tune_hnsw.py --path ./pumed --collection pubmed_collection --limit 20000 --apply
+    python tune_hnsw.py --path chroma_db --collection medical_documents --target-recall 0.98 --apply
+"""
+import argparse
+import itertools
+import os
+import time
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+
+from hnsw_config import save_params
+
+
+def rss_bytes() -> int:
+    # Resident set size on Linux; 0 where /proc is unavailable
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def load_vectors(path: str, collection_name: str, limit: int) -> np.ndarray:
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=path).get_collection(name=collection_name)
+    data = collection.get(limit=limit, include=["embeddings"])
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    # Cosine space: normalize once so brute force is a dot product
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, kth=min(k, len(vectors) - 1), axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+def evaluate(vectors: np.ndarray, queries: np.ndarray, truth: List[set], k: int, params: Dict[str, int]) -> Dict[str, Any]:
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    name = f"tune_{uuid.uuid4().hex[:8]}"
+    before = rss_bytes()
+    started = time.perf_counter()
+    collection = client.create_collection(
+        name=name,
+        metadata={
+            "hnsw:space": "cosine",
+            "hnsw:M": params["M"],
+            "hnsw:construction_ef": params["construction_ef"],
+            "hnsw:search_ef": params["search_ef"]
+        }
+    )
+    ids = [str(i) for i in range(len(vectors))]
+    for i in range(0, len(vectors), 5000):
+        collection.add(ids=ids[i:i + 5000], embeddings=vectors[i:i + 5000])
+    build_seconds = time.perf_counter() - started
+    measured = rss_bytes() - before
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=k, include=["distances"])
+        latencies.append(1000 * (time.perf_counter() - started))
+        hits += len(expected & {int(i) for i in result["ids"][0]})
+    client.delete_collection(name=name)
+
+    # hnswlib layout: vector + 2*M links on layer 0 (4 bytes each) per element
+    estimate = len(vectors) * (4 * vectors.shape[1] + 8 * params["M"])
+    return {
+        **params,
+        "recall": round(hits / (k * len(queries)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "build_s": round(build_seconds, 2),
+        "memory_mb": round(max(measured, estimate) / 2 ** 20, 1)
+    }
+
+
+def choose(results: List[Dict[str, Any]], target_recall: float) -> Dict[str, Any]:
+    # Fastest setting that meets the recall target, else the most accurate one
+    good = [r for r in results if r["recall"] >= target_recall]
+    if good:
+        return min(good, key=lambda r: (r["p99_ms"], r["memory_mb"]))
+    return max(results, key=lambda r: (r["recall"], -r["p99_ms"]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall-vs-latency tuning of HNSW parameters.")
+    parser.add_argument("--path", default="./pumed", help="ChromaDB directory")
+    parser.add_argument("--collection", default="pubmed_collection")
+    parser.add_argument("--limit", type=int, default=20000, help="vectors used to build candidate indexes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--M", type=int, nargs="+", default=[16, 32, 48])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200, 400])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--apply", action="store_true", help="save the chosen parameters for this collection")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.path, args.collection, args.limit)
+    rng = np.random.RandomState(0)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    truth = exact_neighbours(vectors, queries, args.k)
+    print(f"📐 {len(vectors)} vectors (dim {vectors.shape[1]}), {len(queries)} queries, recall@{args.k}")
+
+    results = []
+    print(f"  {'M':>3} {'c_ef':>5} {'s_ef':>5} {'recall':>7} {'p50 ms':>7} {'p99 ms':>7} {'build s':>8} {'MB':>7}")
+    for m, construction_ef, search_ef in itertools.product(args.M, args.construction_ef, args.search_ef):
+        r = evaluate(vectors, queries, truth, args.k, {"M": m, "construction_ef": construction_ef, "search_ef": search_ef})
+        results.append(r)
+        print(f"  {m:>3} {construction_ef:>5} {search_ef:>5} {r['recall']:>7.4f} {r['p50_ms']:>7.3f} "
+              f"{r['p99_ms']:>7.3f} {r['build_s']:>8.2f} {r['memory_mb']:>7.1f}")
+
+    best = choose(results, args.target_recall)
+    print(f"🏆 Chosen for '{args.collection}': M={best['M']}, construction_ef={best['construction_ef']}, "
+          f"search_ef={best['search_ef']} (recall {best['recall']}, p99 {best['p99_ms']} ms)")
+    if args.apply:
+        save_params(args.collection, best)
+        print("💾 Saved; new or rebuilt collections will use these parameters.")
+
+
+if __name__ == "__main__":
+    main()